@@ -6,18 +6,30 @@ from vispy import gloo
 from vispy.util.transforms import *
 from vispy.io import imread, imsave
 from vispy.scene import Image
-from operator import add
 from vispy.geometry import *
-from ctypes import *
 import numpy
 import time
-libvolume = cdll.LoadLibrary("GLShadow/shadow_volume.so")
 
 from GLShadow.Camera import Camera
-from GLShadow.Light import Light
+from GLShadow.Light import Light, LIGHT_OMNIDIRECTIONAL
 from GLShadow.Utils import *
 from GLShadow.SceneObject import SceneObject
-from GLShadow.ObjParser import ObjParser
+from GLShadow.MeshRegistry import meshRegistry
+from GLShadow.SceneBatch import SceneBatch
+from GLShadow.ContourEdges import ContourEdges, SilhouetteBatch
+from GLShadow.VolumeExtrusion import extrudeContour
+from GLShadow.SilhouetteQuads import SilhouetteQuads
+from GLShadow.IncrementalSilhouette import IncrementalSilhouette
+from GLShadow.OrbitCache import OrbitCache
+from GLShadow.GpuTimer import GpuTimer
+from GLShadow.StreamingBuffer import StreamingBuffer
+from GLShadow.VolumeWorker import VolumeWorker
+from GLShadow.DepthMap import *
+from GLShadow.ShadowAtlas import ShadowAtlas, MIN_TILE_SIZE
+from GLShadow.LightFrustum import *
+from GLShadow.VolumeCulling import *
+from GLShadow.MeshCache import computeBounds
+from GLShadow.Instancing import *
 
 DEFAULT_COLOR = (0.7, 0.7, 0.7, 1)
 DEFAULT_SHAPE = (1920,1080)
@@ -28,34 +40,65 @@ class AbstractAlgorithm:
 
     def init(self, objects, camera, lights, options):
         self._objects = objects
-        self._positions = gloo.VertexBuffer(self._concatPositions())
-        self._indices = gloo.IndexBuffer(numpy.array(self._concatIndices()))
-        self._normals = gloo.VertexBuffer(self._concatNormals())
+        # objects sharing a mesh are drawn with one instanced call, the others
+        # are also merged in one batch (used by the shadow map pass)
+        self._instancing = isInstancingSupported()
+        self._groups = groupObjects(self._objects, self._instancing)
+        self._batchObjects = [group.getFirst() for group in self._groups if not group.isInstanced()]
+        self._batch = SceneBatch(self._batchObjects)
+        self._positions = gloo.VertexBuffer(self._batch.getPositions())
+        self._indices = gloo.IndexBuffer(self._batch.getIndices())
+        self._normals = gloo.VertexBuffer(self._batch.getNormals())
         self._camera = camera
         self._lights = lights
         self._options = options
         if not self._options:
-            self._options = {"anti-aliasing-int" : "4", 
-                             "anti-aliasing-float" : "4.0",
+            self._options = {"anti-aliasing-int" : "2", 
+                             "anti-aliasing-float" : "2.0",
                              "spreading" : "700.0",
-                             "bias" : "0.05"}
-        vertex_str, fragment_str = self._loadShaders()
-        vertex_texture, fragment_texture = self._loadShaders(texture=True)
+                             "bias" : "0.05",
+                             "gpu-extrusion" : "1",
+                             "incremental-silhouette" : "1",
+                             "orbit-cache" : "0",
+                             "orbit-cache-mb" : "256",
+                             "packed-volumes" : "1",
+                             "volume-culling" : "1",
+                             "pipelined-volumes" : "1",
+                             "shadow-map-size" : "1024",
+                             "shadow-map-format" : "24",
+                             "shadow-map-fit" : "1",
+                             "shadow-cascades" : "1",
+                             "shadow-atlas-size" : "2048"}
+        # "orbit-cache" : shadow data memoized per light position on its orbit
+        self._orbitCache = None
+        if self._options.get("orbit-cache", "0") == "1":
+            capacity = int(float(self._options.get("orbit-cache-mb", "256")) * 1024 * 1024)
+            self._orbitCache = OrbitCache(capacity, release=self._releaseCached)
+        self._sceneVersion = 0
+        # ring vertex buffer of the geometry rebuilt while rendering
+        self._stream = None
+        shaders = {}
 
         self._projection = self._createProjectionMatrix()
+        # one program for each group of objects
         self._programs = []
-        for obj in self._objects:
+        for group in self._groups:
+            obj = group.getFirst()
+            key = (bool(obj.getTexture()), group.isInstanced())
+            if key not in shaders:
+                shaders[key] = self._loadShaders(texture=key[0], instanced=key[1])
+            newProg = self._createProgram(*shaders[key])
             if obj.getTexture():
-                newProg = gloo.Program(vertex_texture, fragment_texture)
                 newProg['u_texture'] = gloo.Texture2D(imread(obj.getTexture()))
                 newProg['texcoord'] = obj.getTexBuffer()
+            elif group.isInstanced():
+                newProg['instance_color'] = group.getColorBuffer(DEFAULT_COLOR)
             else:
-                newProg = gloo.Program(vertex_str, fragment_str)
                 if obj.getColor():
                     newProg['u_color'] = obj.getColorAlpha()
                 else:
                     newProg['u_color'] = DEFAULT_COLOR
-            newProg['position'] = obj.getVertexBuffer()
+            group.bind(newProg)
             newProg['u_projection'] = self._projection
             self._programs.append(newProg)
 
@@ -67,10 +110,26 @@ class AbstractAlgorithm:
     def timedUpdate(self):
         start = time.time() 
         self.update()
+        if self._stream is not None:
+            self._stream.endFrame()
         elapsed = time.time()
         elapsed = elapsed - start
         self._fps = 1/elapsed
 
+    def _createProgram(self, vertex, fragment):
+        """ program of a group of objects """
+        return gloo.Program(vertex, fragment)
+
+    def _releaseCached(self, value):
+        """ called on the values dropped by the orbit cache """
+        pass
+
+    def getStreamingBuffer(self):
+        """ StreamingBuffer for the per frame geometry, created on first use """
+        if self._stream is None:
+            self._stream = StreamingBuffer()
+        return self._stream
+
     def getFPS(self):
         """ """
         return self._fps
@@ -80,27 +139,33 @@ class AbstractAlgorithm:
 
     def draw(self):
         view = self._createViewMatrix()
-        for i in range(len(self._objects)):
-            obj = self._objects[i]
+        for i in range(len(self._programs)):
+            group = self._groups[i]
             prog = self._programs[i]
-            model = numpy.eye(4, dtype=numpy.float32)
-            translate(model, *obj.getPosition())
-            prog['u_model'] = model
+            prog['u_model'] = group.getModelMatrix()
             prog['u_view'] = view
-            prog.draw('triangles', obj.getIndexBuffer())
+            group.draw(prog)
 
         for i in range(len(self._lightPrograms)):
-            obj = self._lightObjects[i]
+            group = self._lightGroups[i]
             prog = self._lightPrograms[i]
-            model = numpy.eye(4,dtype=numpy.float32)
-            translate(model, *obj.getPosition())
-            prog['u_model'] = model
+            # the markers follow the lights
+            group.updatePositions()
+            prog['u_model'] = group.getModelMatrix()
             prog['u_view'] = view
-            prog.draw('triangles', obj.getIndexBuffer())
+            group.draw(prog)
 
     def terminate(self):
         """ Method to stop algorithm """
         self.active = False
+        for obj in getattr(self, "_lightObjects", []):
+            meshRegistry.releaseObject(obj)
+        self._lightObjects = []
+        if getattr(self, "_orbitCache", None) is not None:
+            self._orbitCache.clear()
+        if getattr(self, "_stream", None) is not None:
+            self._stream.release()
+            self._stream = None
         self._objects = []
         self._positions = []
         self._indices = []
@@ -118,7 +183,7 @@ class AbstractAlgorithm:
     def _createProjectionMatrix(self):
         return perspective(60, 16.0/9.0, 0.1, 200)
 
-    def _loadShaders(self, texture=False, vertex_filename=None, fragment_filename=None):
+    def _loadShaders(self, texture=False, vertex_filename=None, fragment_filename=None, instanced=False):
         if not vertex_filename:
             vertex_filename = self.VERTEX_SHADER_FILENAME
         if not fragment_filename:
@@ -139,12 +204,24 @@ class AbstractAlgorithm:
             fragment_str = fragment_str.replace("$COLOR_VARIABLES$", "varying vec2 v_texcoord;\nuniform sampler2D u_texture;\n")
             fragment_str = fragment_str.replace("$COLOR_CODE$", "vec4 v_color = texture2D(u_texture, v_texcoord);\n")
 
+        elif instanced:
+            vertex_str = vertex_str.replace("$COLOR_VARIABLES$", INSTANCE_COLOR_VARIABLES)
+            vertex_str = vertex_str.replace("$COLOR_CODE$", INSTANCE_COLOR_CODE)
+            fragment_str = fragment_str.replace("$COLOR_VARIABLES$", "varying vec4 v_color;\n")
+            fragment_str = fragment_str.replace("$COLOR_CODE$", "");
         else:
             vertex_str = vertex_str.replace("$COLOR_VARIABLES$", "uniform vec4 u_color;\nvarying vec4 v_color;\n")
             vertex_str = vertex_str.replace("$COLOR_CODE$", "v_color = u_color;\n")
             fragment_str = fragment_str.replace("$COLOR_VARIABLES$", "varying vec4 v_color;\n")
             fragment_str = fragment_str.replace("$COLOR_CODE$", "");
 
+        if instanced:
+            vertex_str = vertex_str.replace("$INSTANCE_VARIABLES$", INSTANCE_VARIABLES)
+            vertex_str = vertex_str.replace("$INSTANCE_CODE$", INSTANCE_CODE)
+        else:
+            vertex_str = vertex_str.replace("$INSTANCE_VARIABLES$", "")
+            vertex_str = vertex_str.replace("$INSTANCE_CODE$", SINGLE_CODE)
+
         if (self._options):
             for key, value in self._options.iteritems():
                 vertex_str = vertex_str.replace('$'+key+'$', value)
@@ -158,48 +235,25 @@ class AbstractAlgorithm:
     def _createLightObjects(self):
         objects = []
         for light in self._lights:
-            sphere = ObjParser("assets/obj/spotlight/spotlight.obj")
-            newObj = SceneObject(sphere.getVertices(), sphere.getFaces(), sphere.getNormals(), light.getPosition(), [0.5,0.5,0.5])
+            # every light marker shares the same mesh
+            newObj = meshRegistry.createObject("assets/obj/spotlight/spotlight.obj", light.getPosition(), [0.5,0.5,0.5])
             objects.append(newObj)
         return objects
 
     def _createLightPrograms(self):
+        # all the markers share a mesh : usually a single instanced program
+        self._lightGroups = groupObjects(self._lightObjects, self._instancing)
         programs = []
-        for obj in self._lightObjects:
-            newProg = gloo.Program("shaders/light.vertexshader", "shaders/light.fragmentshader")
-            newProg['position'] = obj.getVertexBuffer()
-            newProg['u_color'] = obj.getColorAlpha()
+        for group in self._lightGroups:
+            newProg = gloo.Program(*self._loadShaders(vertex_filename="shaders/light.vertexshader",
+                                                      fragment_filename="shaders/light.fragmentshader",
+                                                      instanced=group.isInstanced()))
+            group.bind(newProg)
+            newProg['u_color'] = group.getFirst().getColorAlpha()
             newProg['u_projection'] = self._projection
             programs.append(newProg)
         return programs
 
-    def _concatPositions(self):
-        def move(vertices, position):
-            return [[vertex[i]+position[i] for i in range(len(vertex))] for vertex in vertices]
-        verticesList = [obj.getVertices().tolist() for obj in self._objects]
-        positionList = [obj.getPosition() for obj in self._objects]
-        ret = []
-        for i in range(len(verticesList)):
-            ret.extend(move(verticesList[i], positionList[i]))
-        return ret
-
-    # add index so mesh reference only their vertices
-    def _concatIndices(self):
-        indicesList = [obj.getIndices().tolist() for obj in self._objects]
-        def addIndices(newIndices, indices):
-            max_index = max(newIndices)+1 if len(newIndices) > 0 else 0
-            try:
-                newIndices.extend([item+max_index for sublist in indices for item in sublist])
-            except:
-                newIndices.extend([item+max_index for item in indices])
-            return newIndices
-        return reduce(addIndices, indicesList, [])
-
-    def _concatNormals(self):
-        normalsList = [obj.getNormals().tolist() for obj in self._objects]
-        return reduce(add, normalsList, [])
-
-
 class ShadowMapAlgorithm(AbstractAlgorithm):
     FRAGMENT_SHADER_FILENAME = "shaders/shadowmapalgo.fragmentshader"
     VERTEX_SHADER_FILENAME = "shaders/shadowmapalgo.vertexshader"
@@ -207,60 +261,343 @@ class ShadowMapAlgorithm(AbstractAlgorithm):
                                 [0.0, 0.5, 0.0, 0.0],
                                 [0.0, 0.0, 0.5, 0.0],
                                 [0.5, 0.5, 0.5, 1.0]])
+    # u_light_modes : how the fragment shader picks the map of a light
+    MODE_CASCADES = 0
+    MODE_SPOT = 1
+    MODE_CUBE = 2
     def __init__(self):
         AbstractAlgorithm.__init__(self)
-        # assign members that never change
-        self._shadowProgram = gloo.Program("shaders/shadowmap.vertexshader",
-                                        "shaders/shadowmap.fragmentshader")
 
     def init(self, objects, camera, lights, options):
         """ Method that initialize the algorithm """
+        # "shadow-cascades" : maps per directional light, a point light needs
+        # a cube of 6. Every light has the same number of slots (the shaders
+        # index the maps with light * slots + slot)
+        self._cascades = max(1, int((options or {}).get("shadow-cascades", "1")))
+        self._slots = self._cascades
+        if [light for light in lights if light.getType() in LIGHT_OMNIDIRECTIONAL]:
+            self._slots = max(self._slots, len(CUBE_FACES))
         AbstractAlgorithm.init(self, objects, camera, lights, options)
 
         for i in range(len(self._programs)):
-            obj = self._objects[i]
+            obj = self._groups[i].getFirst()
             prog = self._programs[i]
-            prog['u_bias_matrix'] = self.BIAS_MATRIX
             prog['normal'] = obj.getNormalBuffer()
+            # the objects of a group share their shadow flags
+            prog['u_receives_shadow'] = 1.0 if obj.receivesShadow() else 0.0
 
+        # shadow pass : the batch of single objects, then one instanced call per shared mesh
+        self._shadowProgram = gloo.Program(*self._loadShaders(vertex_filename="shaders/shadowmap.vertexshader",
+                                                              fragment_filename="shaders/shadowmap.fragmentshader"))
         self._shadowProgram['position'] = self._positions
-        # Shadow map
-        self._shadowMaps = []
-        self._frameBuffers = []
-        for light in self._lights:
-            shadowMap = gloo.Texture2D(shape=(DEFAULT_SHAPE[1], DEFAULT_SHAPE[0], 4), dtype=numpy.float32)
-            self._shadowMaps.append(shadowMap)
-            self._frameBuffers.append(gloo.FrameBuffer(shadowMap))
+        self._shadowInstanceGroups = [group for group in self._groups if group.isInstanced()]
+        self._shadowInstancePrograms = []
+        for group in self._shadowInstanceGroups:
+            prog = gloo.Program(*self._loadShaders(vertex_filename="shaders/shadowmap.vertexshader",
+                                                   fragment_filename="shaders/shadowmap.fragmentshader",
+                                                   instanced=True))
+            group.bind(prog)
+            self._shadowInstancePrograms.append(prog)
+        # every map (map k = light * slots + slot) is a tile of one atlas,
+        # "shadow-map-size" texels wide unless the light has its own size or
+        # the atlas has no room for it
+        self._maxTextureSize = int(GL.glGetIntegerv(GL.GL_MAX_TEXTURE_SIZE))
+        self._depthFormat = self._options.get("shadow-map-format", "24")
+        atlasSize = powerOfTwo(int(self._options.get("shadow-atlas-size", "2048")), self._maxTextureSize)
+        self._atlas = ShadowAtlas(atlasSize, self._depthFormat)
+        nbMaps = len(self._lights) * self._slots
+        # tile of each map, and the one its depth is in (None : not rendered)
+        self._tiles = [None for k in range(nbMaps)]
+        self._renderedTiles = [None for k in range(nbMaps)]
+        # a map is rendered again if its light was modified or its projection changed
+        self._shadowMapFrames = [0 for k in range(nbMaps)]
+        self._shadowMapRenders = 0
+        self._shadowTriangles = 0
+        self._frame = 0
+        # "shadow-map-fit" : light frustums fitted to the visible casters
+        self._fitLightFrustum = self._options.get("shadow-map-fit", "1") == "1"
+        self._casterBounds = None
+        self._casterBoundsVersion = None
+        self._objectBounds = {}
+        self._shadowMapProjections = [None for k in range(nbMaps)]
+        self._shadowMapViews = [None for k in range(nbMaps)]
+        self._lightViews = [None for light in self._lights]
+        self._lightModes = [None for light in self._lights]
+        self._cascadeSplits = None
+        self._cubeRotations = cubeFaceRotations()
+
+    def _loadShaders(self, *args, **kwargs):
+        """ """
+        vertex_str, fragment_str = AbstractAlgorithm._loadShaders(self, *args, **kwargs)
+        cascades = getattr(self, "_cascades", 1)
+        slots = getattr(self, "_slots", cascades)
+        for name, value in (("$SHADOW_CASCADES$", cascades), ("$SHADOW_SLOTS$", slots),
+                            ("$SHADOW_MAPS$", len(self._lights) * slots)):
+            vertex_str = vertex_str.replace(name, str(value))
+            fragment_str = fragment_str.replace(name, str(value))
+        return vertex_str, fragment_str
+
+    def _createProgram(self, vertex, fragment):
+        """ the shadow atlas is sampled with depth comparison """
+        return DepthCompareProgram(vertex, fragment, "u_shadow_atlas", 1)
+
+    def _releaseCached(self, shadowMap):
+        """ delete a shadow map dropped by the orbit cache (the atlas has a copy) """
+        shadowMap.release()
+
+    def getShadowMapSize(self, light):
+        """ requested size of the maps of a light, their tiles may be smaller """
+        size = light.getShadowMapSize() or int(self._options.get("shadow-map-size", "1024"))
+        return powerOfTwo(size, self._atlas.getSize())
+
+    def getTileSize(self, k):
+        """ size of the tile of map k (MIN_TILE_SIZE if it has none) """
+        return self._tiles[k][2] if self._tiles[k] is not None else MIN_TILE_SIZE
+
+    def getSlotCount(self, mode):
+        """ number of maps a light of this mode uses """
+        if self.getCasterBounds() is None:
+            return 1
+        if mode == self.MODE_CUBE:
+            return len(CUBE_FACES)
+        if mode == self.MODE_SPOT:
+            return 1
+        return self._cascades
+
+    def getLightImportance(self, light):
+        """ brightest channel of a light over its distance to the camera """
+        eye = numpy.array([self._camera.getX(), self._camera.getY(), self._camera.getZ()], dtype=numpy.float32)
+        distance = numpy.linalg.norm(numpy.asarray(light.getPosition()[:3], dtype=numpy.float32) - eye)
+        return max(light.getIntensity()[:3]) / max(float(distance), 1.0)
+
+    def allocateTiles(self):
+        """ give a tile of the atlas to each map in use, the most important
+        lights keeping their size when the atlas is full """
+        requests = []
+        for i in range(len(self._lights)):
+            light = self._lights[i]
+            size = self.getShadowMapSize(light)
+            importance = self.getLightImportance(light)
+            for slot in range(self.getSlotCount(self._lightModes[i])):
+                requests.append((i * self._slots + slot, size, importance))
+        tiles = self._atlas.allocate(requests)
+        for k in range(len(self._tiles)):
+            self._tiles[k] = tiles.get(k)
+            if self._tiles[k] is None:
+                self.releaseShadowMap(k)
+
+    def getShadowMapRenders(self):
+        """ number of shadow maps rendered since init """
+        return self._shadowMapRenders
+
+    def getShadowTriangles(self):
+        """ number of triangles drawn by the shadow passes since init """
+        return self._shadowTriangles
+
+    def getLightMode(self, light):
+        """ MODE_CUBE for a point light (if the maps have room for a cube),
+        MODE_SPOT for a spot, else MODE_CASCADES """
+        if light.getType() in LIGHT_OMNIDIRECTIONAL and self._slots >= len(CUBE_FACES):
+            return self.MODE_CUBE
+        if light.getType() == "Spot":
+            return self.MODE_SPOT
+        return self.MODE_CASCADES
+
+    def isShadowMapDirty(self, k, projection, period=1):
+        """ True if map k must be rendered again (its light not being
+        modified). A new projection only is taken every period frames """
+        if self._renderedTiles[k] != self._tiles[k]:
+            return True
+        if numpy.array_equal(self._shadowMapProjections[k], projection):
+            return False
+        return self._frame - self._shadowMapFrames[k] >= period
+
+    def getCasterBounds(self):
+        """ world space bounds of the objects casting shadows, None if none does """
+        if self._casterBoundsVersion != self._sceneVersion:
+            casters = [obj for obj in self._objects if obj.castsShadow()]
+            self._casterBounds = sceneBounds(casters, 0.0) if casters else None
+            self._casterBoundsVersion = self._sceneVersion
+            self._objectBounds = {}
+            self._cascadeSplits = None
+        return self._casterBounds
+
+    def getObjectBounds(self, obj):
+        """ world space bounds of obj """
+        self.getCasterBounds()
+        if id(obj) not in self._objectBounds:
+            self._objectBounds[id(obj)] = sceneBounds([obj], 0.0)
+        return self._objectBounds[id(obj)]
+
+    def getCascadeSplits(self):
+        """ view depths splitting the camera frustum in "shadow-cascades"
+        cascades, up to the far end of the scene (not of the camera) : they
+        only change with the scene """
+        self.getCasterBounds()
+        if self._cascadeSplits is None:
+            # the receivers too
+            bounds = sceneBounds(self._objects, 0.0)
+            near, far = projectionDepthRange(self._projection)
+            far = max(min(far, float(numpy.linalg.norm(bounds[1] - bounds[0]))), near * 2)
+            self._cascadeSplits = cascadeSplits(near, far, self._cascades)
+        return self._cascadeSplits
+
+    def getLightView(self, light):
+        """ view matrix of a light : a translation for a cube of maps (its
+        faces add their rotation) """
+        mode = self.getLightMode(light)
+        if mode == self.MODE_CUBE:
+            view = numpy.eye(4, dtype=numpy.float32)
+            translate(view, *[-x for x in light.getPosition()[:3]])
+            return view
+        if mode == self.MODE_SPOT:
+            return lookTowards(light.getPosition(), light.getDirection())
+        # TODO direction of a directional light
+        return lookAt(light.getPosition(), (0,2,0), (0,1,0))
+
+    def getLightProjections(self, mode, light, lightView, sizes):
+        """ (rotation, projection) of each map of a light : the map is
+        rendered with the view lightView.rotation, sizes are the sizes of
+        their tiles """
+        identity = numpy.eye(4, dtype=numpy.float32)
+        if self.getCasterBounds() is None:
+            return [(identity, ortho(-5, +5, -5, +5, 10, 50))]
+        if mode == self.MODE_CUBE:
+            projection = fitCube(light.getPosition(), self.getCasterBounds())
+            return [(rotation, projection) for rotation in self._cubeRotations]
+        if mode == self.MODE_SPOT:
+            return [(identity, fitPerspective(lightView, light.getConeAngle(), self.getCasterBounds()))]
+        if not self._fitLightFrustum:
+            return [(identity, ortho(-5, +5, -5, +5, 10, 50)) for c in range(self._cascades)]
+        corners = frustumCorners(self._createViewMatrix(), self._projection)
+        if self._cascades == 1:
+            return [(identity, fitOrtho(lightView, corners, self.getCasterBounds(), sizes[0]))]
+        near, far = projectionDepthRange(self._projection)
+        splits = self.getCascadeSplits()
+        return [(identity, fitOrtho(lightView, sliceCorners(corners, near, far, splits[c], splits[c + 1]),
+                                    self.getCasterBounds(), sizes[c])) for c in range(self._cascades)]
+
+    def getShadowMapMemory(self):
+        """ bytes of the shadow atlas """
+        return self._atlas.getMemory()
+
+    def terminate(self):
+        """ """
+        AbstractAlgorithm.terminate(self)
+        if getattr(self, "_atlas", None) is not None:
+            self._atlas.release()
+            self._atlas = None
+
+    def releaseShadowMap(self, k):
+        """ forget the depth of map k, its tile may be given to other maps """
+        self._renderedTiles[k] = None
+
+    def drawCasters(self, matrix):
+        """ draw the casters in the frustum of the view projection matrix :
+        their ranges of the batch, each instanced group if one of its
+        instances is in it """
+        inFrustum = lambda obj: obj.castsShadow() and boxInFrustum(self.getObjectBounds(obj), matrix)
+        ranges = [self._batch.getIndexRange(obj) for obj in self._batchObjects if inFrustum(obj)]
+        self._shadowTriangles += drawRanges(self._shadowProgram, self._indices, ranges) // 3
+        for j in range(len(self._shadowInstanceGroups)):
+            group = self._shadowInstanceGroups[j]
+            if [obj for obj in group.getObjects() if inFrustum(obj)]:
+                group.draw(self._shadowInstancePrograms[j])
+                self._shadowTriangles += len(group.getFirst().getIndices()) // 3 * len(group)
+
+    def setShadowMap(self, k, view, rotation, projection):
+        """ take the matrices of map k, its depth being rendered or pasted
+        into its tile this frame """
+        view = numpy.dot(view, rotation)
+        self._shadowMapViews[k] = view
+        self._shadowMapProjections[k] = projection
+        self._shadowMapFrames[k] = self._frame
+        self._renderedTiles[k] = self._tiles[k]
+        matrix = numpy.asarray(numpy.dot(numpy.dot(rotation, projection), self.BIAS_MATRIX), dtype=numpy.float32)
+        for prog in self._programs:
+            prog['u_shadow_matrices[%d]' % k] = matrix
+
+    def renderShadowMap(self, k):
+        """ render map k into its tile, the atlas being bound """
+        self._shadowMapRenders += 1
+        self._atlas.beginTile(self._tiles[k])
+        for prog in [self._shadowProgram] + self._shadowInstancePrograms:
+            prog['u_model'] = numpy.eye(4, dtype=numpy.float32)
+            prog['u_view'] = self._shadowMapViews[k]
+            prog['u_projection'] = self._shadowMapProjections[k]
+        self.drawCasters(numpy.dot(self._shadowMapViews[k], self._shadowMapProjections[k]))
 
     def update(self):
         """ Method to call on each OpenGL update """
         if self.active:
             AbstractAlgorithm.update(self)
-            # create shadow map for each light
-            for i in range(len(self._frameBuffers)):
-                # create shadow map matrices
-                shadow_model = numpy.eye(4, dtype=numpy.float32)
-                shadow_view = lookAt(self._lights[i].getPosition(), (0,2,0), (0,1,0))
-                # TODO change in function of light type
-                shadow_projection = ortho(-5, +5, -5, +5, 10, 50)
-                for prog in self._programs:
-                    prog['u_depth_model[%d]' % i] = shadow_model
-                    prog['u_depth_view[%d]' % i] = shadow_view
-                    prog['u_depth_projection[%d]' % i] = shadow_projection
-                # create shadow map
-                with self._frameBuffers[i]:
-                    self._shadowProgram['u_model'] = shadow_model
-                    self._shadowProgram['u_view'] = shadow_view
-                    self._shadowProgram['u_projection'] = shadow_projection
-                    self._shadowProgram.draw('triangles', self._indices)
+            modified = []
+            for i in range(len(self._lights)):
+                light = self._lights[i]
+                # the flag is reset before the position is read
+                modified.append(light.takeModified())
+                if modified[i] or self._lightViews[i] is None:
+                    self._lightViews[i] = self.getLightView(light)
+                    self._lightModes[i] = self.getLightMode(light)
+            self.allocateTiles()
+            # the dirty maps, pasted from the orbit cache or rendered
+            rendered = []
+            for i in range(len(self._lights)):
+                light = self._lights[i]
+                sizes = [self.getTileSize(i * self._slots + slot) for slot in range(self._slots)]
+                projections = self.getLightProjections(self._lightModes[i], light, self._lightViews[i], sizes)
+                for slot in range(len(projections)):
+                    k = i * self._slots + slot
+                    # dropped by the atlas
+                    if self._tiles[k] is None:
+                        continue
+                    rotation, projection = projections[slot]
+                    # only the first cascade follows every move of the
+                    # camera, cascade c at most every 2^c frames
+                    period = 2 ** slot if self._lightModes[i] == self.MODE_CASCADES else 1
+                    if not modified[i] and not self.isShadowMapDirty(k, projection, period):
+                        continue
+                    self.setShadowMap(k, self._lightViews[i], rotation, projection)
+                    key = None
+                    if self._orbitCache is not None:
+                        key = self._orbitCache.key(light.getPosition(), "shadowmap", self._sceneVersion, sizes[slot],
+                                                    slot, self._lightViews[i].tostring(), projection.tostring())
+                        shadowMap = self._orbitCache.get(key)
+                        if shadowMap is not None:
+                            self._atlas.pasteTile(shadowMap, self._tiles[k])
+                            continue
+                    rendered.append((k, key))
+            # a single framebuffer bind for all of them
+            if rendered:
+                with self._atlas:
+                    for k, key in rendered:
+                        self.renderShadowMap(k)
+                # the orbit cache keeps a copy of the tile
+                for k, key in rendered:
+                    if key is not None:
+                        shadowMap = DepthMap(self._tiles[k][2], self._depthFormat)
+                        self._atlas.copyTile(self._tiles[k], shadowMap)
+                        self._orbitCache.put(key, shadowMap, shadowMap.getMemory())
+            self._frame += 1
 
             # draw each object
-            for prog in self._programs:
+            splits = self.getCascadeSplits()
+            for j in range(len(self._programs)):
+                prog = self._programs[j]
                 for i in range(len(self._lights)):
                     prog['u_lights_intensity[%d]' % i] = self._lights[i].getIntensity()
                     prog['u_lights_position[%d]' % i] = self._lights[i].getPosition()
-                for i in range(len(self._shadowMaps)):
-                    prog['u_shadow_maps[%d]' % i] = self._shadowMaps[i]
+                    # the shadow maps are rendered in world space
+                    prog['u_depth_model[%d]' % i] = self._groups[j].getModelMatrix()
+                    prog['u_depth_view[%d]' % i] = self._lightViews[i]
+                    prog['u_light_modes[%d]' % i] = float(self._lightModes[i])
+                for c in range(self._cascades):
+                    prog['u_cascade_splits[%d]' % c] = splits[c + 1]
+                # a map without tile is lit
+                for k in range(len(self._tiles)):
+                    rect = self._atlas.getRectangle(self._tiles[k]) if self._tiles[k] is not None else (0, 0, 0, -1)
+                    prog['u_shadow_rects[%d]' % k] = rect
+            self._atlas.bindTexture(SHADOW_MAP_UNIT)
             self.draw()
 
             # draw shadowmap as minimap
@@ -316,17 +653,15 @@ class SelfShadowAlgorithm(AbstractAlgorithm):
         AbstractAlgorithm.init(self, objects, camera, lights, options)
 
         for i in range(len(self._programs)):
-            obj = self._objects[i]
+            obj = self._groups[i].getFirst()
             prog = self._programs[i]
             prog['normal'] = obj.getNormalBuffer()
 
     def update(self):
         if self.active:
             for i in range(len(self._programs)):
-                obj = self._objects[i]
                 prog = self._programs[i]
-                model = numpy.eye(4, dtype=numpy.float32)
-                translate(model, *obj.getPosition())
+                model = self._groups[i].getModelMatrix()
                 view = self._createViewMatrix()
                 normal = numpy.array(numpy.matrix(numpy.dot(view, model)).I.T)
                 prog['u_normal'] = normal
@@ -335,12 +670,6 @@ class SelfShadowAlgorithm(AbstractAlgorithm):
             self.draw()
 
 
-class Vector(Structure):
-    _fields_ = ("x", c_float), ("y", c_float), ("z", c_float)
-
-class Edge(Structure):
-    _fields_ = ("one", Vector), ("two", Vector)
-
 class ShadowVolumeAlgorithm(AbstractAlgorithm):
     VERTEX_SHADER_FILENAME="shaders/shadowvolume.vertexshader"
     FRAGMENT_SHADER_FILENAME="shaders/shadowvolume.fragmentshader"
@@ -353,175 +682,386 @@ class ShadowVolumeAlgorithm(AbstractAlgorithm):
 
         shape=DEFAULT_SHAPE
 
-        self.C_positions = [None for _ in range(len(self._objects))]
-        self.C_indices = [None for _ in range(len(self._objects))]
-        self.C_normals = [None for _ in range(len(self._objects))]
-        self.C_size_indices = [None for _ in range(len(self._objects))]
-        self.C_contour_edges = [None for _ in range(len(self._objects))]
-        self.C_nb_edges = [None for _ in range(len(self._objects))]
+        # "gpu-extrusion" : the silhouette is found and extruded by the vertex
+        # shader from static per mesh buffers, otherwise by libvolume
+        self._gpuExtrusion = self._options.get("gpu-extrusion", "1") == "1"
+        # "incremental-silhouette" : each (object, light) pair patches its
+        # previous silhouette instead of testing every face again
+        self._incremental = self._options.get("incremental-silhouette", "1") == "1"
+        # "packed-volumes" : the volumes of every object are drawn by one call
+        # per light in world space, with two-sided stencil operations
+        self._packed = self._options.get("packed-volumes", "1") == "1"
+        # "volume-culling" : the volumes out of the camera frustum are not
+        # drawn, the others only within their window rectangle and depth range
+        self._culling = self._options.get("volume-culling", "1") == "1"
+        self._culler = VolumeCuller(self._projection, DEFAULT_SHAPE)
+        self._depthBounds = self._culling and isDepthBoundsSupported()
+        # contour edges are computed on the mesh arrays, shared between instances
+        contours = {}
+        quads = {}
+        self._contours = [None for _ in range(len(self._objects))]
         self._volumePrograms = [None for _ in range(len(self._objects))]
+        if self._gpuExtrusion:
+            volumeVertexShader = "shaders/shadowvolumegpu.vertexshader"
+        else:
+            volumeVertexShader = "shaders/shadowvolumealgo.vertexshader"
         vertex_str, fragment_str = \
-            self._loadShaders(vertex_filename="shaders/shadowvolumealgo.vertexshader",\
+            self._loadShaders(vertex_filename=volumeVertexShader,\
                               fragment_filename="shaders/shadowvolumealgo.fragmentshader")
         for i in range(len(self._objects)):
-            self.C_positions[i] = (Vector * len(self._objects[i].getVertices()))
-            j = 0
-            self.C_positions[i] = self.C_positions[i]()
-            for pos in self.C_positions[i]:
-                pos.x = self._objects[i].getVertices()[j][0]
-                pos.y = self._objects[i].getVertices()[j][1]
-                pos.z = self._objects[i].getVertices()[j][2]
-                j += 1
-
-            self.C_indices[i] = c_int * len(self._objects[i].getIndices())
-            k = 0
-            self.C_indices[i] = self.C_indices[i]()
-            for index in self.C_indices[i]:
-                self.C_indices[i][k] = self._objects[i].getIndices()[k]
-                k += 1
-
-            self.C_normals[i] = Vector * len(self._objects[i].getNormals())
-            l = 0
-            self.C_normals[i] = self.C_normals[i]()
-            for normal in self.C_normals[i]:
-                normal.x = self._objects[i].getNormals()[l][0]
-                normal.y = self._objects[i].getNormals()[l][1]
-                normal.z = self._objects[i].getNormals()[l][2]
-                l += 1
-
-            self.C_size_indices[i] = c_int(len(self._objects[i].getIndices()))
-
-            len_edges = len(self._objects[i].getVertices()) * 3
-            self.C_contour_edges[i] = Edge * len_edges
-            self.C_contour_edges[i] = self.C_contour_edges[i]()
-
-            self.C_nb_edges[i] = pointer(c_int(0))
-
+            mesh = self._objects[i].getMesh()
             self._volumePrograms[i] = gloo.Program(vertex_str, fragment_str)
             self._volumePrograms[i]['u_projection'] = self._projection
             # ortho(-5, +5, -5, +5, 10, 50)
             self._volumePrograms[i]['u_bias_matrix'] = ShadowMapAlgorithm.BIAS_MATRIX
-        self.createVolumes()
+            if self._gpuExtrusion:
+                if id(mesh) not in quads:
+                    quads[id(mesh)] = SilhouetteQuads(mesh.getVertices(), mesh.getAdjacency())
+                if not self._packed:
+                    quads[id(mesh)].bind(self._volumePrograms[i])
+            else:
+                if id(mesh) not in contours:
+                    contours[id(mesh)] = ContourEdges.forMesh(mesh)
+                self._contours[i] = contours[id(mesh)]
+        if self._gpuExtrusion:
+            self._silhouetteQuads = quads.values()
+        else:
+            self._silhouetteQuads = []
+        self._meshQuads = quads
+        # packed : world space volumes, one vertex buffer per light (cpu) or
+        # the silhouette quads of the whole scene (gpu)
+        self._packedProgram = gloo.Program(vertex_str, fragment_str)
+        self._packedProgram['u_projection'] = self._projection
+        self._packedProgram['u_bias_matrix'] = ShadowMapAlgorithm.BIAS_MATRIX
+        self._packedProgram['u_model'] = numpy.eye(4, dtype=numpy.float32)
+        self._packedQuads = None
+        self._packedVersion = None
+        self._packedArrays = {}
+        self._packedDirty = set()
+        # stencil pass statistics
+        self._stencilTimers = []
+        self._stencilDrawCalls = 0
+        self._stencilArea = 0.0
+        # the volumes are extruded until they leave the scene bounds
+        self._volumeBounds = {}
+        self._boundsKeys = {}
+        self.updateSceneBounds()
+        # volume of each (object, light) pair, the (object position, light
+        # position) it was computed for and its range in the streaming buffer
+        self._silhouettes = None
+        self._incrementalSilhouettes = {}
+        self._volumeArrays = {}
+        self._volumePositions = {}
+        self._volumeKeys = {}
+        self._volumeAllocations = {}
+        self._computedBounds = None
+        self._worker = None
+        if not self._gpuExtrusion:
+            self.createVolumes()
+            # "pipelined-volumes" : the volumes of the next frame are computed
+            # by a worker while this one is drawn (one frame of latency)
+            if self._options.get("pipelined-volumes", "1") == "1":
+                self._worker = VolumeWorker(self.computeVolumes)
+                self._worker.start()
 
         self.active = True
             
 
+    def terminate(self):
+        """ """
+        if getattr(self, "_worker", None) is not None:
+            self._worker.stop()
+            self._worker = None
+        AbstractAlgorithm.terminate(self)
+
     # http://nuclear.mutantstargoat.com/articles/volume_shadows_tutorial_nuclear.pdf
+    def snapshotVolumes(self):
+        """ what the volumes of a frame depend on : the light and object
+        positions and the scene bounds, copied for the worker thread """
+        lights = [tuple(light.getPosition()[:3]) for light in self._lights]
+        objects = [tuple(obj.getPosition()[:3]) for obj in self._objects]
+        return lights, objects, self._sceneBounds.copy()
+
     def createVolumes(self):
-        # for each object
-        lightPosition = range(len(self._objects))
-        for i in range(len(self._objects)):
-            model = numpy.eye(4, dtype=numpy.float32)
-            translate(model, *self._objects[i].getPosition())
-            light = numpy.dot(self._lights[0].getPosition() + [0], numpy.linalg.inv(model))
-            lightPosition[i] = Vector(x=light[0],y=light[1],z=light[2])
-
-            libvolume.findContourEdges(self.C_positions[i], self.C_indices[i], self.C_normals[i], self.C_size_indices[i],lightPosition[i], self.C_contour_edges[i], self.C_nb_edges[i])
-            vertices = []
-            size = self.C_nb_edges[i].contents.value
-            for j in range(size):
-                edge = self.C_contour_edges[i][j]
-                vertices.extend([numpy.array([vec.x, vec.y, vec.z]) for vec in [edge.one, edge.two]])
-            light = numpy.array([light[0], light[1], light[2]])
-
-            center = [sum(v[j] for v in vertices)/(size*2) for j in range(3)]
-            lightDir = numpy.subtract(light, center)
-
-            def clockwise(v1, v2):
-                return numpy.dot(lightDir, numpy.cross(numpy.subtract(v1, center), numpy.subtract(v2, center))) >= 0
-
-            for j in range(0, len(vertices), 2):
-                if not clockwise(vertices[j], vertices[j+1]):
-                    tmp = vertices[j]
-                    vertices[j] = vertices[j+1]
-                    vertices[j+1] = tmp
-
-            self.createShadowTriangles(vertices, i)
-        self._lights[0].setModified(False)
-
-    def createShadowTriangles(self, vertices, index):
-        model = numpy.eye(4, dtype=numpy.float32)
-        translate(model, *self._objects[index].getPosition())
-        lightPosition = numpy.array(numpy.dot(self._lights[0].getPosition() + [0], numpy.linalg.inv(model)).tolist()[:-1])
-        extrudeMagnitude = 100
-        newVertices = []
-        for i in range(0, len(vertices), 2):
-            a = vertices[i]
-            b = vertices[i+1]
-            c = numpy.add(b, extrudeMagnitude * numpy.subtract(b, lightPosition))
-            d = numpy.add(a, extrudeMagnitude * numpy.subtract(a, lightPosition))
-            newVertices.extend([a,b,c])
-            newVertices.extend([a,c,d])
-        self._volumePrograms[index]['position'] = gloo.VertexBuffer(newVertices)
-
-    def drawVolumes(self):
+        """ compute the volumes of the (object, light) pairs that moved """
+        self.applyVolumes(self.computeVolumes(self.snapshotVolumes()))
+
+    def computeVolumes(self, snapshot):
+        """ volumes of the pairs that changed since the previous snapshot :
+        (reset, [(object, light, volume, bounds, object position)]), volume
+        and bounds in object space, reset if every volume was computed again.
+        No GL here : this runs on the worker when "pipelined-volumes" is set"""
+        lights, objects, bounds = snapshot
+        nbLights = len(lights)
+        reset = False
+        if self._silhouettes is None or self._silhouettes.getNbLights() != nbLights:
+            self._silhouettes = SilhouetteBatch(self._contours, nbLights)
+            self._incrementalSilhouettes = {}
+            self._volumeKeys = {}
+            reset = True
+        if self._computedBounds is None or not numpy.array_equal(bounds, self._computedBounds):
+            # the volumes are clamped to the bounds : every one is extruded again
+            self._computedBounds = bounds
+            self._volumeKeys = {}
+        # every light in the space of each object
+        lightPositions = numpy.empty((len(objects), nbLights, 3), dtype=numpy.float32)
+        active = numpy.zeros(len(objects) * nbLights, dtype=numpy.bool_)
+        keys = {}
+        for l in range(nbLights):
+            for i in range(len(objects)):
+                keys[(i, l)] = (objects[i], lights[l])
+                lightPositions[i, l] = numpy.subtract(lights[l], objects[i])
+                active[i * nbLights + l] = self._volumeKeys.get((i, l)) != keys[(i, l)]
+        volumes = []
+        if self._orbitCache is not None:
+            for j in numpy.flatnonzero(active):
+                i, l = divmod(j, nbLights)
+                cached = self._orbitCache.get(self._volumeCacheKey(i, lightPositions[i, l], objects[i], bounds))
+                if cached is not None:
+                    volumes.append((i, l) + cached + (objects[i],))
+                    self._volumeKeys[(i, l)] = keys[(i, l)]
+                    active[j] = False
+        if not active.any():
+            return reset, volumes
+        if self._incremental:
+            for j in numpy.flatnonzero(active):
+                i, l = divmod(j, nbLights)
+                if (i, l) not in self._incrementalSilhouettes:
+                    self._incrementalSilhouettes[(i, l)] = IncrementalSilhouette(self._contours[i])
+                edges = self._incrementalSilhouettes[(i, l)].update(lightPositions[i, l])
+                volumes.append(self.createShadowTriangles(edges, i, l, lightPositions[i, l], objects[i], bounds))
+                self._volumeKeys[(i, l)] = keys[(i, l)]
+            return reset, volumes
+        # silhouettes of all the moved pairs in one native call
+        self._silhouettes.find(lightPositions, active)
+        for j in numpy.flatnonzero(active):
+            i, l = divmod(j, nbLights)
+            volumes.append(self.createShadowTriangles(self._silhouettes.getEdges(i, l), i, l,
+                                                      lightPositions[i, l], objects[i], bounds))
+            self._volumeKeys[(i, l)] = keys[(i, l)]
+        return reset, volumes
+
+    def applyVolumes(self, result):
+        """ install the volumes returned by computeVolumes """
+        reset, volumes = result
+        if reset:
+            self._volumeArrays = {}
+            self._volumeBounds = {}
+            self._volumePositions = {}
+            self._volumeAllocations = {}
+            self._packedArrays = {}
+        for volume in volumes:
+            self._setVolume(*volume)
+
+    def _volumeCacheKey(self, index, lightPosition, objectPosition, bounds):
+        """ the volume only depends on the mesh, the light and the scene bounds
+        in object space """
+        bounds = numpy.round(bounds - objectPosition, 3)
+        return self._orbitCache.key(lightPosition, "volume", id(self._objects[index].getMesh()), tuple(bounds.ravel()))
+
+    def updateSceneBounds(self):
+        """ bounds the volumes are clamped to, after the objects moved """
+        self._sceneBounds = sceneBounds(self._objects)
+        self._boundsVersion = self._sceneVersion
+        if self._gpuExtrusion:
+            for prog in self._volumePrograms + [self._packedProgram]:
+                prog['u_scene_min'] = self._sceneBounds[0]
+                prog['u_scene_max'] = self._sceneBounds[1]
+
+    def getVolumeBounds(self, index, lightIndex):
+        """ world space bounds of the volume of an object for a light """
+        if not self._gpuExtrusion:
+            return self._volumeBounds[(index, lightIndex)]
+        # the vertex shader extrudes : bounds of the volume of the mesh bounds
+        obj = self._objects[index]
+        light = self._lights[lightIndex].getPosition()
+        key = (tuple(obj.getPosition()), tuple(light), self._boundsVersion)
+        if self._boundsKeys.get((index, lightIndex)) != key:
+            self._volumeBounds[(index, lightIndex)] = coneBounds(obj.getMesh().getBounds() + obj.getPosition(),
+                                                                 light, self._sceneBounds)
+            self._boundsKeys[(index, lightIndex)] = key
+        return self._volumeBounds[(index, lightIndex)]
+
+    def createShadowTriangles(self, edges, index, lightIndex, lightPosition, objectPosition, sceneBounds):
+        """ (object, light, volume, bounds, object position) of a silhouette """
+        volume = extrudeContour(edges, lightPosition, bounds=sceneBounds - objectPosition)
+        if len(volume) == 0:
+            # nothing faces the light : a degenerate triangle
+            volume = numpy.zeros((3, 3), dtype=numpy.float32)
+        bounds = computeBounds(volume)
+        if self._orbitCache is not None:
+            self._orbitCache.put(self._volumeCacheKey(index, lightPosition, objectPosition, sceneBounds),
+                                 (volume, bounds), volume.nbytes)
+        return index, lightIndex, volume, bounds, objectPosition
+
+    def _setVolume(self, index, lightIndex, volume, bounds, position):
+        """ new volume (object space) of a pair : uploaded when it is drawn """
+        self._volumeArrays[(index, lightIndex)] = volume
+        self._volumePositions[(index, lightIndex)] = position
+        self._volumeBounds[(index, lightIndex)] = bounds + position
+        self._volumeAllocations.pop((index, lightIndex), None)
+        self._packedDirty.add(lightIndex)
+
+    def _streamVolume(self, key, volume):
+        """ view of volume in the streaming buffer, written again if its
+        range was reused since the last frame """
+        stream = self.getStreamingBuffer()
+        allocation = self._volumeAllocations.get(key)
+        if allocation is None or not stream.isValid(allocation):
+            allocation = stream.write(volume)
+            self._volumeAllocations[key] = allocation
+        return stream.use(allocation)
+
+    def packVolumes(self):
+        """ merge the volumes of each light that changed (cpu) or the
+        silhouette quads of the moved scene (gpu) in world space """
+        if self._gpuExtrusion:
+            if self._packedVersion != self._sceneVersion:
+                if self._packedQuads is not None:
+                    self._packedQuads.releaseBuffers()
+                self._packedQuads = SilhouetteQuads.merge(
+                    [self._meshQuads[id(obj.getMesh())] for obj in self._objects],
+                    [obj.getPosition() for obj in self._objects])
+                self._packedQuads.bind(self._packedProgram)
+                self._packedVersion = self._sceneVersion
+            return
+        for l in self._packedDirty:
+            self._packedArrays[l] = numpy.concatenate([self._volumeArrays[(i, l)] + numpy.asarray(self._volumePositions[(i, l)], dtype=numpy.float32)
+                                                       for i in range(len(self._objects))])
+            self._volumeAllocations.pop(("packed", l), None)
+        self._packedDirty = set()
+
+    def drawPackedVolumes(self, lightIndex=0):
+        """ every volume of a light in one draw call : front faces increment
+        and back faces decrement the stencil in the same pass """
+        if self._culling:
+            rectangles = [self.getVolumeRectangle(i, lightIndex) for i in range(len(self._objects))]
+            rectangles = [r for r in rectangles if r is not None]
+            if not rectangles:
+                return
+            self._limitFill(VolumeCuller.union(rectangles))
+        gloo.set_state(None, stencil_test=True, cull_face=False)
+        gloo.set_stencil_func('always', 0, ~0)
+        gloo.set_stencil_op('keep', 'keep', 'incr_wrap', face='front')
+        gloo.set_stencil_op('keep', 'keep', 'decr_wrap', face='back')
+        prog = self._packedProgram
+        prog['u_view'] = self._createViewMatrix()
+        if self._gpuExtrusion:
+            prog['u_light_position'] = self._lights[lightIndex].getPosition()
+        else:
+            prog['position'] = self._streamVolume(("packed", lightIndex), self._packedArrays[lightIndex])
+        prog.draw('triangles')
+        self._stencilDrawCalls += 1
+
+    def getVolumeRectangle(self, index, lightIndex):
+        """ window rectangle and depth range of a volume, None if it is out of
+        the camera frustum """
+        return self._culler.project(self.getVolumeBounds(index, lightIndex))
+
+    def _limitFill(self, rectangle):
+        """ restrict the stencil pass to a window rectangle and depth range """
+        x, y, width, height, zNear, zFar = rectangle
+        gloo.set_state(None, scissor_test=True)
+        gloo.set_scissor(x, y, width, height)
+        if self._depthBounds:
+            setDepthBounds(zNear, zFar)
+        self._stencilArea += float(width * height) / (DEFAULT_SHAPE[0] * DEFAULT_SHAPE[1])
+
+    def drawVolumes(self, lightIndex=0):
+        if self._packed:
+            self.drawPackedVolumes(lightIndex)
+            return
         # gloo.clear(color=True, depth=True, stencil=True)
         gloo.set_state(None, stencil_test=True, cull_face=True)
         gloo.set_stencil_func('always', 0, ~0)
         # step 3 : draw front faces, depth test and stencil buffer increment
+        # then back faces and decrement (wrapping : the order does not matter)
+        view = self._createViewMatrix()
         for i in range(len(self._objects)):
+            if self._culling:
+                rectangle = self.getVolumeRectangle(i, lightIndex)
+                if rectangle is None:
+                    continue
+                self._limitFill(rectangle)
             prog = self._volumePrograms[i]
-            obj = self._objects[i]
             model = numpy.eye(4, dtype=numpy.float32)
-            translate(model, *obj.getPosition())
+            if self._gpuExtrusion:
+                translate(model, *self._objects[i].getPosition())
+            else:
+                # where the object was when its volume was computed
+                translate(model, *self._volumePositions[(i, lightIndex)])
             prog['u_model'] = model
-            prog['u_view'] = self._createViewMatrix()
-            gloo.set_stencil_op('keep', 'keep', 'decr')
-            gloo.set_cull_face('front')
-            prog.draw('triangles')
-            gloo.set_stencil_op('keep', 'keep', 'incr')
+            prog['u_view'] = view
+            if self._gpuExtrusion:
+                prog['u_light_position'] = self._lights[lightIndex].getPosition()
+            else:
+                prog['position'] = self._streamVolume((i, lightIndex), self._volumeArrays[(i, lightIndex)])
+            gloo.set_stencil_op('keep', 'keep', 'incr_wrap')
             gloo.set_cull_face('back')
             prog.draw('triangles')
-        # step 4 : draw back faces, depth test and stencil buffer decrement
-        # for i in range(len(self._objects)):
-        #     prog = self._volumePrograms[i]
-        #     obj = self._objects[i]
-        #     model = numpy.eye(4, dtype=numpy.float32)
-        #     translate(model, *obj.getPosition())
-        #     prog['u_model'] = model
-        #     prog['u_view'] = self._createViewMatrix()
-        #     prog.draw('triangle_strip')
+            gloo.set_stencil_op('keep', 'keep', 'decr_wrap')
+            gloo.set_cull_face('front')
+            prog.draw('triangles')
+            self._stencilDrawCalls += 2
+
+    def getStencilStats(self):
+        """ (draw calls, milliseconds, area) of the stencil passes of the last
+        frame, the time being None until the first measure is available and
+        the area the sum of the scissor rectangles in viewports (the number
+        of volumes drawn without culling) """
+        area = self._stencilArea
+        if not self._culling:
+            area = float(self._stencilDrawCalls if self._packed else self._stencilDrawCalls / 2)
+        times = [timer.getLast() for timer in self._stencilTimers[:len(self._lights)]]
+        if not times or None in times:
+            return self._stencilDrawCalls, None, area
+        return self._stencilDrawCalls, sum(times), area
 
     def update(self):
         if self.active:
-            if self._lights[0].wasModified():
+            if self._boundsVersion != self._sceneVersion:
+                self.updateSceneBounds()
+            if self._worker is not None:
+                result = self._worker.collect()
+                if result is not None:
+                    self.applyVolumes(result)
+                self._worker.submit(self.snapshotVolumes())
+            elif not self._gpuExtrusion:
                 self.createVolumes()
-            GL.glPushAttrib(GL.GL_DEPTH_BUFFER_BIT | GL.GL_STENCIL_BUFFER_BIT);
+            if self._packed:
+                self.packVolumes()
+            self._culler.setView(self._createViewMatrix())
+            self._stencilDrawCalls = 0
+            self._stencilArea = 0.0
+            GL.glPushAttrib(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT | GL.GL_STENCIL_BUFFER_BIT);
+            # ambient pass : fills the depth buffer
             for prog in self._programs:
                 prog['u_light_color'] = [0,0,0]
             self.draw()
-            for prog in self._programs:
-                prog['u_light_color'] = self._lights[0].getColor()
-            #create shadow volumes
-            # with self._frame_buffer:
-            GL.glPushAttrib(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT | GL.GL_POLYGON_BIT | GL.GL_STENCIL_BUFFER_BIT);
-            GL.glColorMask(0, 0, 0, 0); # do not write to the color buffer
-            GL.glDepthMask(0); # do not write to the depth (Z) buffer
-            self.drawVolumes()
-            GL.glPopAttrib()
-            gloo.set_depth_func('equal')
-            gloo.set_state(None, stencil_test=True)
-            gloo.set_stencil_func('equal', 0, ~0)
-            gloo.set_stencil_op('keep','keep','keep')
-            self.draw()
+            # one additive pass per light, lit where its stencil stays at 0
+            gloo.set_state(None, blend=True)
+            gloo.set_blend_func('one', 'one')
+            for l in range(len(self._lights)):
+                gloo.clear(color=False, depth=False, stencil=True)
+                GL.glPushAttrib(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT | GL.GL_POLYGON_BIT | GL.GL_STENCIL_BUFFER_BIT | GL.GL_SCISSOR_BIT | GL.GL_ENABLE_BIT);
+                GL.glColorMask(0, 0, 0, 0); # do not write to the color buffer
+                GL.glDepthMask(0); # do not write to the depth (Z) buffer
+                if l >= len(self._stencilTimers):
+                    self._stencilTimers.append(GpuTimer())
+                self._stencilTimers[l].begin()
+                self.drawVolumes(l)
+                self._stencilTimers[l].end()
+                GL.glPopAttrib()
+                for prog in self._programs:
+                    prog['u_light_color'] = self._lights[l].getColor()
+                gloo.set_depth_func('equal')
+                gloo.set_state(None, stencil_test=True)
+                gloo.set_stencil_func('equal', 0, ~0)
+                gloo.set_stencil_op('keep','keep','keep')
+                self.draw()
             GL.glPopAttrib()
 
 
-            # gloo.set_state(None, cull_face=True)
-            # gloo.set_cull_face('back')
-            # for prog in self._volumePrograms:
-            #     prog['u_model'] = numpy.eye(4, dtype=numpy.float32)
-            #     prog['u_view'] = self._createViewMatrix()
-            #     prog['u_color'] = [1,0,0,1]
-            #     prog.draw('triangles')
-            # gloo.set_cull_face('front')
-            # for prog in self._volumePrograms:
-            #     prog['u_model'] = numpy.eye(4, dtype=numpy.float32)
-            #     prog['u_view'] = self._createViewMatrix()
-            #     prog['u_color'] = [0,0,1,1]
-            #     prog.draw('triangles')
-
-
 if __name__ == '__main__':
     # unit test for shadow volume contour edges
     cube_positions = [[1,1,1],[1,1,0],[0,1,0],[0,1,1],
@@ -0,0 +1,108 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+from ctypes import *
+import numpy
+from numpy.ctypeslib import ndpointer
+
+from GLShadow.EdgeAdjacency import EdgeAdjacency
+
+libvolume = cdll.LoadLibrary("GLShadow/shadow_volume.so")
+libvolume.findSilhouetteEdges.restype = c_int
+libvolume.findSilhouetteEdges.argtypes = [ndpointer(numpy.float32, flags="C_CONTIGUOUS"),
+                                          ndpointer(numpy.int32, flags="C_CONTIGUOUS"),
+                                          c_int,
+                                          ndpointer(numpy.float32, flags="C_CONTIGUOUS"),
+                                          ndpointer(numpy.float32, flags="C_CONTIGUOUS"),
+                                          ndpointer(numpy.float32, flags="C_CONTIGUOUS,WRITEABLE")]
+libvolume.findSilhouetteEdgesBatch.restype = None
+libvolume.findSilhouetteEdgesBatch.argtypes = [c_int, c_int, POINTER(c_void_p), POINTER(c_void_p),
+                                               ndpointer(numpy.int32, flags="C_CONTIGUOUS"),
+                                               POINTER(c_void_p),
+                                               ndpointer(numpy.float32, flags="C_CONTIGUOUS"),
+                                               c_void_p,
+                                               ndpointer(numpy.float32, flags="C_CONTIGUOUS,WRITEABLE"),
+                                               ndpointer(numpy.int32, flags="C_CONTIGUOUS"),
+                                               ndpointer(numpy.int32, flags="C_CONTIGUOUS,WRITEABLE"),
+                                               c_int]
+
+
+class ContourEdges(object):
+    """ Silhouette edges of a mesh seen from a light, computed by libvolume.
+    The edge adjacency of the mesh is built (or read from the cache) once,
+    each query is then a linear pass over the edges. The arrays are handed to
+    the library as pointers and the (E, 2, 3) float32 output is allocated
+    once, find() returns a view on the edges found."""
+    def __init__(self, vertices, indices, adjacency=None):
+        self._positions = numpy.ascontiguousarray(numpy.asarray(vertices)[:, :3], dtype=numpy.float32)
+        if adjacency is None:
+            adjacency = EdgeAdjacency.build(vertices, indices)
+        self._adjacency = adjacency
+        self._edges = numpy.empty((len(adjacency), 2, 3), dtype=numpy.float32)
+
+    @staticmethod
+    def forMesh(mesh):
+        """ """
+        return ContourEdges(mesh.getVertices(), mesh.getIndices(), mesh.getAdjacency())
+
+    def getPositions(self):
+        """ """
+        return self._positions
+
+    def getAdjacency(self):
+        """ """
+        return self._adjacency
+
+    def find(self, lightPosition):
+        """ (nbEdges, 2, 3) view of the contour edges for a light in object space.
+        The view is overwritten by the next call"""
+        light = numpy.ascontiguousarray(numpy.asarray(lightPosition)[:3], dtype=numpy.float32)
+        size = libvolume.findSilhouetteEdges(self._positions, self._adjacency.getEdges(), len(self._adjacency),
+                                             self._adjacency.getPlanes(), light, self._edges)
+        return self._edges[:size]
+
+
+class SilhouetteBatch(object):
+    """ Contour edges of several objects for several lights in one libvolume
+    call, spread over a native thread pool (the GIL is released meanwhile).
+    The edges of every (object, light) pair are written in one float32
+    buffer : find() returns it with the offset and the count of each pair."""
+    def __init__(self, contours, nbLights=1, threads=0):
+        self._contours = contours
+        self._nbLights = nbLights
+        self._threads = threads
+        nbObjects = len(contours)
+        self._positions = (c_void_p * nbObjects)(*[c.getPositions().ctypes.data for c in contours])
+        self._edgeArrays = (c_void_p * nbObjects)(*[c.getAdjacency().getEdges().ctypes.data for c in contours])
+        self._planes = (c_void_p * nbObjects)(*[c.getAdjacency().getPlanes().ctypes.data for c in contours])
+        self._nbEdges = numpy.array([len(c.getAdjacency()) for c in contours], dtype=numpy.int32)
+        capacities = numpy.repeat(self._nbEdges, nbLights)
+        self._offsets = numpy.concatenate(([0], numpy.cumsum(capacities)[:-1])).astype(numpy.int32)
+        self._counts = numpy.zeros(len(capacities), dtype=numpy.int32)
+        self._edges = numpy.empty((max(int(capacities.sum()), 1), 2, 3), dtype=numpy.float32)
+
+    def getNbLights(self):
+        """ """
+        return self._nbLights
+
+    def find(self, lightPositions, active=None):
+        """ lightPositions is (nbObjects, nbLights, 3) : every light in the space of every object.
+        active is an optional (nbObjects * nbLights) boolean array of the pairs
+        to compute, the others keep their previous edges.
+        Return (edges, offsets, counts), the edges of the pair (object, light)
+        being edges[offsets[j]:offsets[j] + counts[j]] with j = object * nbLights + light"""
+        lights = numpy.ascontiguousarray(numpy.asarray(lightPositions)[..., :3], dtype=numpy.float32)
+        activePointer = None
+        if active is not None:
+            active = numpy.ascontiguousarray(active, dtype=numpy.uint8)
+            activePointer = active.ctypes.data
+        libvolume.findSilhouetteEdgesBatch(len(self._contours), self._nbLights, self._positions,
+                                           self._edgeArrays, self._nbEdges, self._planes, lights,
+                                           activePointer, self._edges, self._offsets, self._counts,
+                                           self._threads)
+        return self._edges, self._offsets, self._counts
+
+    def getEdges(self, objectIndex, lightIndex=0):
+        """ view of the edges found by the last find() for an object and a light """
+        j = objectIndex * self._nbLights + lightIndex
+        return self._edges[self._offsets[j]:self._offsets[j] + self._counts[j]]
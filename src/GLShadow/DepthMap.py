@@ -0,0 +1,129 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+from OpenGL import GL
+from vispy import gloo
+
+# texture units of the shadow maps, above the ones gloo gives to its samplers
+SHADOW_MAP_UNIT = 8
+# "shadow-map-format" option : internal format and bytes per texel
+DEPTH_FORMATS = {"16": (GL.GL_DEPTH_COMPONENT16, 2),
+                 "24": (GL.GL_DEPTH_COMPONENT24, 4),
+                 "32f": (GL.GL_DEPTH_COMPONENT32F, 4)}
+
+
+def powerOfTwo(size, maximum=None):
+    """ smallest power of two >= size, at most maximum """
+    result = 1
+    while result < size:
+        result *= 2
+    if maximum is not None:
+        result = min(result, maximum)
+    return result
+
+
+class DepthMap(object):
+    """ Square depth texture attached alone to a framebuffer (the depth only
+    shadow pass), sampled with the hardware depth comparison : a
+    sampler2DShadow lookup returns the lit fraction of the 2x2 nearest texels.
+    Raw GL : gloo has no depth textures nor shadow samplers."""
+    def __init__(self, size, depthFormat="24"):
+        self._size = size
+        self._format, self._texelSize = DEPTH_FORMATS.get(depthFormat, DEPTH_FORMATS["24"])
+        self._texture = GL.glGenTextures(1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texture)
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, self._format, size, size, 0,
+                        GL.GL_DEPTH_COMPONENT, GL.GL_FLOAT, None)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
+        # out of the map : lit
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_BORDER)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_BORDER)
+        GL.glTexParameterfv(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_BORDER_COLOR, [1.0, 1.0, 1.0, 1.0])
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_COMPARE_MODE, GL.GL_COMPARE_R_TO_TEXTURE)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_COMPARE_FUNC, GL.GL_LEQUAL)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        self._frameBuffer = GL.glGenFramebuffers(1)
+        previous = int(GL.glGetIntegerv(GL.GL_FRAMEBUFFER_BINDING))
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self._frameBuffer)
+        GL.glFramebufferTexture2D(GL.GL_FRAMEBUFFER, GL.GL_DEPTH_ATTACHMENT, GL.GL_TEXTURE_2D, self._texture, 0)
+        GL.glDrawBuffer(GL.GL_NONE)
+        GL.glReadBuffer(GL.GL_NONE)
+        status = GL.glCheckFramebufferStatus(GL.GL_FRAMEBUFFER)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, previous)
+        if status != GL.GL_FRAMEBUFFER_COMPLETE:
+            print("[ERROR] depth map framebuffer incomplete (0x%x)" % status)
+        self._previous = None
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, *args):
+        self.end()
+
+    def begin(self, clear=True):
+        """ render into the map : depth only, cleared unless clear is False """
+        self._previous = int(GL.glGetIntegerv(GL.GL_FRAMEBUFFER_BINDING))
+        GL.glPushAttrib(GL.GL_VIEWPORT_BIT | GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT |
+                        GL.GL_POLYGON_BIT | GL.GL_ENABLE_BIT | GL.GL_SCISSOR_BIT)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self._frameBuffer)
+        GL.glViewport(0, 0, self._size, self._size)
+        GL.glColorMask(0, 0, 0, 0)
+        GL.glDepthMask(1)
+        GL.glEnable(GL.GL_DEPTH_TEST)
+        if clear:
+            GL.glClear(GL.GL_DEPTH_BUFFER_BIT)
+        # slope scaled offset against self shadowing
+        GL.glEnable(GL.GL_POLYGON_OFFSET_FILL)
+        GL.glPolygonOffset(1.1, 4.0)
+
+    def end(self):
+        """ """
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self._previous)
+        GL.glPopAttrib()
+
+    def bindTexture(self, unit):
+        """ bind the map to a texture unit for the lighting pass """
+        GL.glActiveTexture(GL.GL_TEXTURE0 + unit)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texture)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+
+    def getSize(self):
+        """ """
+        return self._size
+
+    def getFrameBuffer(self):
+        """ """
+        return self._frameBuffer
+
+    def getMemory(self):
+        """ bytes of the texture """
+        return self._size * self._size * self._texelSize
+
+    def release(self):
+        """ delete the texture and the framebuffer """
+        if self._texture is not None:
+            GL.glDeleteFramebuffers(1, [self._frameBuffer])
+            GL.glDeleteTextures([self._texture])
+            self._texture = None
+            self._frameBuffer = None
+
+
+class DepthCompareProgram(gloo.Program):
+    """ gloo Program whose fragment shader samples shadow maps through an
+    array of sampler2DShadow (declared with a macro size so that gloo does
+    not parse it). The samplers get the units SHADOW_MAP_UNIT + i right
+    after the link, before gloo validates the program."""
+    def __init__(self, vertex, fragment, samplerName, count):
+        gloo.Program.__init__(self, vertex, fragment)
+        self._samplerName = samplerName
+        self._samplerCount = count
+
+    def _build(self):
+        gloo.Program._build(self)
+        GL.glUseProgram(self.handle)
+        for i in range(self._samplerCount):
+            location = GL.glGetUniformLocation(self.handle, "%s[%d]" % (self._samplerName, i))
+            if location >= 0:
+                GL.glUniform1i(location, SHADOW_MAP_UNIT + i)
@@ -0,0 +1,90 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+import numpy
+
+from GLShadow.MeshCache import getMeshCache
+
+
+class EdgeAdjacency(object):
+    """ Edges of a mesh with their two adjacent faces, built once per mesh.
+    Vertices sharing a position are welded first, so meshes whose vertices
+    are duplicated for their normals or texture coordinates stay closed.
+    edges is (E, 4) int32 : v0, v1 (in the winding of face0), face0, face1
+    (-1 for a border edge). planes is (F, 4) float32 : normal and d of each
+    face, a point p is in front of the face when dot(normal, p) + d > 0."""
+    def __init__(self, edges, planes):
+        self._edges = numpy.ascontiguousarray(edges, dtype=numpy.int32)
+        self._planes = numpy.ascontiguousarray(planes, dtype=numpy.float32)
+
+    def getEdges(self):
+        """ """
+        return self._edges
+
+    def getPlanes(self):
+        """ """
+        return self._planes
+
+    def __len__(self):
+        return len(self._edges)
+
+    @staticmethod
+    def build(vertices, indices):
+        """ """
+        positions = numpy.asarray(vertices, dtype=numpy.float32)[:, :3] + numpy.float32(0.0)  # -0.0 -> 0.0
+        faces = numpy.asarray(indices).reshape((-1, 3)).astype(numpy.int64)
+        if len(faces) == 0:
+            return EdgeAdjacency(numpy.zeros((0, 4)), numpy.zeros((0, 4)))
+        _, welded = numpy.unique(positions, axis=0, return_inverse=True)
+        welded = welded.ravel()[faces]
+
+        corners = positions[faces]
+        normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        planes = numpy.empty((len(faces), 4), dtype=numpy.float32)
+        planes[:, :3] = normals
+        planes[:, 3] = -numpy.einsum("ij,ij->i", normals, corners[:, 0])
+
+        # directed edges (a, b) of the faces, degenerate faces have none
+        valid = ((welded[:, 0] != welded[:, 1]) & (welded[:, 1] != welded[:, 2]) &
+                 (welded[:, 2] != welded[:, 0]))
+        validFaces = numpy.flatnonzero(valid)
+        first = faces[validFaces]
+        second = first[:, [1, 2, 0]]
+        weldedFirst = welded[validFaces]
+        weldedSecond = weldedFirst[:, [1, 2, 0]]
+        edgeFaces = numpy.repeat(validFaces, 3)
+        low = numpy.minimum(weldedFirst, weldedSecond).ravel()
+        high = numpy.maximum(weldedFirst, weldedSecond).ravel()
+        order = numpy.lexsort((high, low))
+        low, high = low[order], high[order]
+        starts = numpy.flatnonzero(numpy.concatenate(([True], (low[1:] != low[:-1]) | (high[1:] != high[:-1]))))
+        counts = numpy.diff(numpy.concatenate((starts, [len(order)])))
+
+        edges = numpy.empty((len(starts), 4), dtype=numpy.int32)
+        firstEdge = order[starts]
+        edges[:, 0] = first.ravel()[firstEdge]
+        edges[:, 1] = second.ravel()[firstEdge]
+        edges[:, 2] = edgeFaces[firstEdge]
+        # a non manifold edge keeps its first two faces
+        edges[:, 3] = -1
+        shared = counts > 1
+        edges[shared, 3] = edgeFaces[order[starts[shared] + 1]]
+        return EdgeAdjacency(edges, planes)
+
+    @staticmethod
+    def forMesh(mesh):
+        """ Adjacency of mesh, read from (or stored in) the cache entry of its file """
+        cache = getMeshCache(mesh.getName()) if mesh.getName() else None
+        if cache is not None:
+            edges = cache.loadExtra("adjacency_edges")
+            planes = cache.loadExtra("adjacency_planes")
+            if edges is not None and planes is not None:
+                return EdgeAdjacency(edges, planes)
+        adjacency = EdgeAdjacency.build(mesh.getVertices(), mesh.getIndices())
+        if cache is not None:
+            try:
+                cache.storeExtra("adjacency_edges", adjacency.getEdges())
+                cache.storeExtra("adjacency_planes", adjacency.getPlanes())
+            except (IOError, OSError), e:
+                print("[WARNING] Unable to write adjacency cache : " + str(e))
+        return adjacency
@@ -0,0 +1,60 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+from OpenGL import GL
+import numpy
+import time
+
+
+class GpuTimer(object):
+    """ Time of a group of GL commands.
+    Uses GL_TIME_ELAPSED queries, read one frame later so that the pipeline
+    is not stalled. Without timer queries it falls back on glFinish and the
+    wall clock (which does stall)."""
+    def __init__(self):
+        self._queries = None
+        self._pending = []
+        self._free = []
+        self._start = None
+        self._last = None
+        try:
+            self._queries = bool(GL.glGenQueries) and bool(GL.glGetQueryObjectui64v)
+        except Exception:
+            self._queries = False
+
+    def begin(self):
+        """ """
+        if self._queries:
+            try:
+                query = self._free.pop() if self._free else GL.glGenQueries(1)
+                GL.glBeginQuery(GL.GL_TIME_ELAPSED, query)
+                self._pending.append(query)
+                return
+            except Exception:
+                self._queries = False
+        GL.glFinish()
+        self._start = time.time()
+
+    def end(self):
+        """ """
+        if self._queries:
+            GL.glEndQuery(GL.GL_TIME_ELAPSED)
+            self._collect()
+        else:
+            GL.glFinish()
+            self._last = (time.time() - self._start) * 1000.0
+
+    def _collect(self):
+        """ read the finished queries """
+        while self._pending:
+            query = self._pending[0]
+            if not GL.glGetQueryObjectiv(query, GL.GL_QUERY_RESULT_AVAILABLE):
+                break
+            result = numpy.zeros(1, dtype=numpy.uint64)
+            GL.glGetQueryObjectui64v(query, GL.GL_QUERY_RESULT, result)
+            self._last = result[0] / 1e6
+            self._free.append(self._pending.pop(0))
+
+    def getLast(self):
+        """ milliseconds of the last measure available, None before the first one """
+        return self._last
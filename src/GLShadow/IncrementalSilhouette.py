@@ -0,0 +1,65 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+from ctypes import *
+import numpy
+from numpy.ctypeslib import ndpointer
+
+from GLShadow.ContourEdges import libvolume
+
+libvolume.createIncrementalSilhouette.restype = c_void_p
+libvolume.createIncrementalSilhouette.argtypes = [ndpointer(numpy.float32, flags="C_CONTIGUOUS"),
+                                                  ndpointer(numpy.int32, flags="C_CONTIGUOUS"),
+                                                  c_int,
+                                                  ndpointer(numpy.float32, flags="C_CONTIGUOUS"),
+                                                  c_int,
+                                                  ndpointer(numpy.float32, flags="C_CONTIGUOUS,WRITEABLE")]
+libvolume.updateIncrementalSilhouette.restype = c_int
+libvolume.updateIncrementalSilhouette.argtypes = [c_void_p, ndpointer(numpy.float32, flags="C_CONTIGUOUS"), c_float]
+libvolume.getIncrementalTestedFaces.restype = c_int
+libvolume.getIncrementalTestedFaces.argtypes = [c_void_p]
+libvolume.destroyIncrementalSilhouette.restype = None
+libvolume.destroyIncrementalSilhouette.argtypes = [c_void_p]
+
+
+class IncrementalSilhouette(object):
+    """ Silhouette of a mesh for a light moving by small steps (libvolume).
+    The facing of every face is kept between two updates. The distance of the
+    light to a face plane changes at most by the distance the light moved, so
+    only the faces whose plane was closer to the light than that (at the last
+    full evaluation) are tested again, and the edges of the faces that
+    flipped are removed from / added to the edge list in place.
+    A full evaluation is done again once more than REBASE_RATIO of the faces
+    would be tested."""
+    REBASE_RATIO = 0.25
+
+    def __init__(self, contours):
+        # the arrays must live as long as the native state
+        self._positions = contours.getPositions()
+        self._adjacency = contours.getAdjacency()
+        edges = self._adjacency.getEdges()
+        planes = self._adjacency.getPlanes()
+        self._output = numpy.empty((max(len(edges), 1), 2, 3), dtype=numpy.float32)
+        self._count = 0
+        self._state = libvolume.createIncrementalSilhouette(self._positions, edges, len(edges),
+                                                            planes, len(planes), self._output)
+
+    def __del__(self):
+        if self._state:
+            libvolume.destroyIncrementalSilhouette(self._state)
+            self._state = None
+
+    def update(self, lightPosition):
+        """ move the light (object space), return the (nbEdges, 2, 3) view of
+        the silhouette in the winding of the unlit faces"""
+        light = numpy.ascontiguousarray(numpy.asarray(lightPosition)[:3], dtype=numpy.float32)
+        self._count = libvolume.updateIncrementalSilhouette(self._state, light, IncrementalSilhouette.REBASE_RATIO)
+        return self.getEdges()
+
+    def getEdges(self):
+        """ """
+        return self._output[:self._count]
+
+    def getTestedFaces(self):
+        """ number of faces tested by the last update """
+        return libvolume.getIncrementalTestedFaces(self._state)
@@ -0,0 +1,164 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+from OpenGL import GL
+from vispy import gloo
+from vispy.util.transforms import translate
+import ctypes
+import numpy
+
+GL_INDEX_TYPES = {numpy.dtype(numpy.uint8): GL.GL_UNSIGNED_BYTE,
+                  numpy.dtype(numpy.uint16): GL.GL_UNSIGNED_SHORT,
+                  numpy.dtype(numpy.uint32): GL.GL_UNSIGNED_INT}
+
+# vertex shader snippets replacing $INSTANCE_VARIABLES$ and $INSTANCE_CODE$
+INSTANCE_VARIABLES = "attribute vec3 instance_position;\n"
+INSTANCE_CODE = "vec3 local_position = position + instance_position;\n"
+SINGLE_CODE = "vec3 local_position = position;\n"
+# per instance color, replacing the u_color uniform of $COLOR_VARIABLES$
+INSTANCE_COLOR_VARIABLES = "attribute vec4 instance_color;\nvarying vec4 v_color;\n"
+INSTANCE_COLOR_CODE = "v_color = instance_color;\n"
+INSTANCE_ATTRIBUTES = ["instance_position", "instance_color"]
+
+
+def isInstancingSupported():
+    """ True if glDrawElementsInstanced and glVertexAttribDivisor are available
+    (needs a current GL context) """
+    try:
+        return bool(GL.glDrawElementsInstanced) and bool(GL.glVertexAttribDivisor)
+    except Exception:
+        return False
+
+
+def instancePositions(objects):
+    """ (N, 3) float32 array of the positions of objects """
+    return numpy.array([obj.getPosition() for obj in objects], dtype=numpy.float32).reshape((-1, 3))
+
+
+def instanceColors(objects, defaultColor):
+    """ (N, 4) float32 array of the colors of objects """
+    colors = [obj.getColorAlpha() if obj.getColor() else defaultColor for obj in objects]
+    return numpy.array(colors, dtype=numpy.float32).reshape((-1, 4))
+
+
+def drawInstanced(program, indexBuffer, count, mode=GL.GL_TRIANGLES):
+    """ Draw count instances of the indexed geometry of program in one call.
+    The attributes named in INSTANCE_ATTRIBUTES advance once per instance """
+    program.activate()
+    handles = []
+    for name in INSTANCE_ATTRIBUTES:
+        attribute = program._attributes.get(name)
+        if attribute is not None and attribute.enabled and attribute.handle >= 0:
+            handles.append(attribute.handle)
+    for handle in handles:
+        GL.glVertexAttribDivisor(handle, 1)
+    indexBuffer.activate()
+    GL.glDrawElementsInstanced(mode, indexBuffer.size, GL_INDEX_TYPES[numpy.dtype(indexBuffer.dtype)],
+                               ctypes.c_void_p(0), count)
+    indexBuffer.deactivate()
+    for handle in handles:
+        GL.glVertexAttribDivisor(handle, 0)
+    GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+    program.deactivate()
+
+
+class InstanceGroup(object):
+    """ Objects sharing one mesh and one texture.
+    A group of several objects is drawn by a single instanced call, the
+    position (and color) of each object being a per instance attribute."""
+    def __init__(self, objects):
+        self._objects = objects
+        self._positionBuffer = None
+        self._colorBuffer = None
+
+    def __len__(self):
+        return len(self._objects)
+
+    def getObjects(self):
+        """ """
+        return self._objects
+
+    def getFirst(self):
+        """ object giving the mesh and the texture of the group """
+        return self._objects[0]
+
+    def isInstanced(self):
+        """ """
+        return len(self._objects) > 1
+
+    def getModelMatrix(self):
+        """ model matrix of the program : positions are per instance when instanced """
+        model = numpy.eye(4, dtype=numpy.float32)
+        if not self.isInstanced():
+            translate(model, *self.getFirst().getPosition())
+        return model
+
+    def getPositionBuffer(self):
+        """ """
+        if self._positionBuffer is None:
+            self._positionBuffer = gloo.VertexBuffer(instancePositions(self._objects))
+        return self._positionBuffer
+
+    def getColorBuffer(self, defaultColor):
+        """ """
+        if self._colorBuffer is None:
+            self._colorBuffer = gloo.VertexBuffer(instanceColors(self._objects, defaultColor))
+        return self._colorBuffer
+
+    def updatePositions(self):
+        """ upload the current positions of the objects """
+        if self.isInstanced():
+            self.getPositionBuffer().set_data(instancePositions(self._objects))
+
+    def bind(self, program):
+        """ set the geometry attributes of program """
+        program['position'] = self.getFirst().getVertexBuffer()
+        if self.isInstanced():
+            program['instance_position'] = self.getPositionBuffer()
+
+    def draw(self, program):
+        """ """
+        if self.isInstanced():
+            drawInstanced(program, self.getFirst().getIndexBuffer(), len(self._objects))
+        else:
+            program.draw('triangles', self.getFirst().getIndexBuffer())
+
+
+def drawRanges(program, indexBuffer, ranges, mode=GL.GL_TRIANGLES):
+    """ Draw the (first index, number of indices) ranges of indexBuffer,
+    one call per run of adjacent ranges. Return the number of indices drawn """
+    runs = []
+    for first, count in sorted(ranges):
+        if runs and runs[-1][0] + runs[-1][1] == first:
+            runs[-1][1] += count
+        else:
+            runs.append([first, count])
+    if not runs:
+        return 0
+    program.activate()
+    indexBuffer.activate()
+    indexType = GL_INDEX_TYPES[numpy.dtype(indexBuffer.dtype)]
+    itemSize = numpy.dtype(indexBuffer.dtype).itemsize
+    for first, count in runs:
+        GL.glDrawElements(mode, int(count), indexType, ctypes.c_void_p(int(first) * itemSize))
+    indexBuffer.deactivate()
+    GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+    program.deactivate()
+    return sum(count for first, count in runs)
+
+
+def groupObjects(objects, instancing=True):
+    """ Split objects in InstanceGroups, keeping the order of their first occurrence.
+    Only objects loaded from the same file (see MeshRegistry) with the same
+    texture and shadow flags are grouped, and only if instancing is enabled."""
+    groups = []
+    byKey = {}
+    for obj in objects:
+        key = (id(obj.getMesh()), obj.getTexture(), obj.castsShadow(), obj.receivesShadow())
+        if instancing and obj.getMesh().getName() is not None and key in byKey:
+            byKey[key].getObjects().append(obj)
+        else:
+            group = InstanceGroup([obj])
+            groups.append(group)
+            byKey[key] = group
+    return groups
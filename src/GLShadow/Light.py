@@ -9,6 +9,8 @@ import threading
 ## ---- ###
 LIGHT_POSSIBILITY = ["Point", "Directionnel", "Spot", "Ligne", "Rond"]
 LIGHT_WITH_DIRECTION = ["Directionnel","Ligne","Spot"]
+# lights shadowing in every direction : a cube of shadow maps
+LIGHT_OMNIDIRECTIONAL = ["Point", "Rond"]
 COLOR_POSSIBILITY = ["Blanc", "Rouge", "Jaune", "Bleu"]
 
 
@@ -29,11 +31,14 @@ class Light(object):
         self.setPosition([xInit, yInit, zInit])
         self._color = [1,1,1]
         self._type = "Point"
+        # side of the shadow map in texels, None : the algorithm default
+        self._shadowMapSize = None
 
         self.modified = False
 
         self._verticalAngle = 45  # 0 vers le bas, 180 vers le plafond
         self._horizontalAngle = 0 # tourne sur lui meme
+        self._coneAngle = 60 # ouverture d'un spot, en degres
 
         self._theta = 0
         self._rayon = math.sqrt(self._xInterval[1]**2 + self._zInterval[1]**2) # warning  self._xInterval
@@ -77,6 +82,23 @@ class Light(object):
         """ """
         return self.modified
 
+    def takeModified(self):
+        """ modified flag, reset at once : for a single reader (the shadow pass) """
+        self.lock.acquire()
+        modified = self.modified
+        self.modified = False
+        self.lock.release()
+        return modified
+
+    def getShadowMapSize(self):
+        """ """
+        return self._shadowMapSize
+
+    def setShadowMapSize(self, size):
+        """ side of the shadow map of this light (rounded to a power of two) """
+        self._shadowMapSize = size
+        self.modified = True
+
     def getType(self):
         """ """
         return self._type
@@ -84,6 +106,7 @@ class Light(object):
     def setType(self, typed):
         """ """
         self._type = typed
+        self.modified = True
 
     def setVerticalAngle(self,angle):
         """ """
@@ -97,11 +120,28 @@ class Light(object):
     def setHorizontalAngle(self,angle):
         """ """
         self._horizontalAngle = angle
+        self.modified = True
 
     def getHorizontalAngle(self):
         """ """
         return self._horizontalAngle 
 
+    def getConeAngle(self):
+        """ """
+        return self._coneAngle
+
+    def setConeAngle(self, angle):
+        """ full opening of a spot, in degrees """
+        self._coneAngle = angle
+        self.modified = True
+
+    def getDirection(self):
+        """ unit vector the light points to : the vertical angle from the
+        floor (0) to the ceiling (180), the horizontal one around y """
+        vertical = self._verticalAngle / Light.RATIO_DEGREE_RADIAN
+        horizontal = self._horizontalAngle / Light.RATIO_DEGREE_RADIAN
+        return (math.sin(vertical) * math.cos(horizontal), -math.cos(vertical), math.sin(vertical) * math.sin(horizontal))
+
     def getDirectionAsVec3f(self):
         """ """
         return (math.cos(self._horizontalAngle), math.sin(self._verticalAngle ), 1)
@@ -0,0 +1,148 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+from vispy.util.transforms import ortho, perspective
+import numpy
+import math
+
+from GLShadow.VolumeCulling import boxCorners
+from GLShadow.Utils import lookAt
+
+# (x, y, z) corners of the normalized device cube
+NDC_CORNERS = numpy.array([[x, y, z, 1] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=numpy.float32)
+# steps of the extent of a fitted map between two powers of two
+EXTENT_STEPS = 8
+# (direction, up) of the faces of a cube of shadow maps : +x, -x, +y, -y, +z, -z
+# (the order of the face selection in shaders/shadowmapalgo.fragmentshader)
+CUBE_FACES = [((1, 0, 0), (0, 1, 0)), ((-1, 0, 0), (0, 1, 0)),
+              ((0, 1, 0), (0, 0, 1)), ((0, -1, 0), (0, 0, 1)),
+              ((0, 0, 1), (0, 1, 0)), ((0, 0, -1), (0, 1, 0))]
+# nearest plane of a perspective light frustum
+MIN_NEAR = 0.1
+
+
+def transformPoints(points, matrix):
+    """ (n, 3) points through a 4x4 matrix (row vector convention) """
+    points = numpy.asarray(points, dtype=numpy.float32)
+    result = numpy.dot(numpy.hstack((points, numpy.ones((len(points), 1), dtype=numpy.float32))), matrix)
+    return result[:, :3] / result[:, 3:4]
+
+
+def frustumCorners(view, projection):
+    """ (8, 3) world space corners of the frustum of a camera """
+    inverse = numpy.linalg.inv(numpy.dot(view, projection))
+    corners = numpy.dot(NDC_CORNERS, inverse)
+    return corners[:, :3] / corners[:, 3:4]
+
+
+def quantizeExtent(extent):
+    """ extent rounded up to one of EXTENT_STEPS steps between two powers of
+    two : the texel size only changes when the extent changes a lot """
+    step = 2.0 ** (math.floor(math.log(extent, 2)) - math.log(EXTENT_STEPS, 2))
+    return math.ceil(extent / step) * step
+
+
+def fitOrtho(lightView, cameraCorners, casterBounds, size, margin=0.5):
+    """ orthographic projection of a light (view matrix lightView) covering
+    what the casters (world space bounds) shadow inside the camera frustum
+    (its corners). If no caster is in it, the map covers the casters : it
+    only has to say that every visible receiver is lit.
+    x and y cover the intersection of both in light space, z every caster
+    (one out of the frustum can shadow a visible receiver). The square is
+    snapped to the texels of a size x size map so that its edges do not
+    shimmer while the camera moves."""
+    casters = transformPoints(boxCorners(casterBounds), lightView)
+    camera = transformPoints(cameraCorners, lightView)
+    low = numpy.maximum(casters.min(axis=0)[:2], camera.min(axis=0)[:2])
+    high = numpy.minimum(casters.max(axis=0)[:2], camera.max(axis=0)[:2])
+    if (high <= low).any():
+        low, high = casters.min(axis=0)[:2], casters.max(axis=0)[:2]
+    texel = quantizeExtent(float((high - low).max())) / (size - 1)
+    low = numpy.floor(low / texel) * texel
+    high = low + texel * size
+    # the light looks towards -z
+    zNear = -casters[:, 2].max() - margin
+    zFar = -casters[:, 2].min() + margin
+    return ortho(low[0], high[0], low[1], high[1], zNear, zFar)
+
+
+def projectionDepthRange(projection):
+    """ (near, far) of a perspective projection matrix (vispy.util.transforms.frustum) """
+    a, b = float(projection[2][2]), float(projection[3][2])
+    return b / (a - 1.0), b / (a + 1.0)
+
+
+def cascadeSplits(near, far, count, blend=0.75):
+    """ count + 1 view depths from near to far splitting the frustum in
+    cascades : a blend of the logarithmic split (constant texel density on
+    screen) and the uniform one (not too small first cascade) """
+    splits = []
+    for c in range(count + 1):
+        ratio = float(c) / count
+        logarithmic = near * (far / near) ** ratio
+        uniform = near + (far - near) * ratio
+        splits.append(blend * logarithmic + (1.0 - blend) * uniform)
+    return splits
+
+
+def sliceCorners(corners, near, far, start, end):
+    """ (8, 3) corners of the part of a frustum (frustumCorners, from near to
+    far) between the view depths start and end : the view depth is linear
+    along the edges from the near to the far corners """
+    nearCorners, farCorners = corners[0::2], corners[1::2]
+    result = numpy.empty_like(corners)
+    for index, depth in ((0, start), (1, end)):
+        t = (depth - near) / (far - near)
+        result[index::2] = nearCorners + t * (farCorners - nearCorners)
+    return result
+
+
+def boxInFrustum(bounds, matrix):
+    """ False if the box is surely out of the frustum of the view projection
+    matrix in x or y or behind it (a caster out of a light frustum cannot
+    shadow into it) """
+    clip = numpy.dot(numpy.hstack((boxCorners(bounds), numpy.ones((8, 1), dtype=numpy.float32))), matrix)
+    w = clip[:, 3:4]
+    if (w <= 1e-6).all():
+        return False
+    if (w <= 1e-6).any():
+        return True
+    return not ((clip[:, :2] > w).all(axis=0).any() or (clip[:, :2] < -w).all(axis=0).any())
+
+
+def lookTowards(position, direction):
+    """ view matrix at position looking towards direction """
+    position = numpy.asarray(position, dtype=numpy.float32)[:3]
+    direction = numpy.asarray(direction, dtype=numpy.float32)
+    up = (0, 1, 0) if abs(direction[1]) < 0.99 else (0, 0, 1)
+    return lookAt(position, position + direction, up)
+
+
+def cubeFaceRotations():
+    """ rotation (view matrix at the origin) of each face of a cube of maps """
+    return [lookAt(numpy.zeros(3, dtype=numpy.float32), numpy.array(direction, dtype=numpy.float32), up)
+            for direction, up in CUBE_FACES]
+
+
+def fitPerspective(lightView, fov, casterBounds):
+    """ perspective projection of a light (view matrix lightView) with a
+    field of view of fov degrees, its depth range fitted to the casters """
+    depths = -transformPoints(boxCorners(casterBounds), lightView)[:, 2]
+    far = max(float(depths.max()), MIN_NEAR * 2)
+    near = max(float(depths.min()), MIN_NEAR)
+    if near >= far * 0.5:
+        near = far * 0.5
+    return perspective(fov, 1.0, near, far)
+
+
+def fitCube(position, casterBounds):
+    """ perspective projection shared by the faces of a cube of maps : 90
+    degrees, from the nearest to the farthest point of the casters """
+    position = numpy.asarray(position, dtype=numpy.float32)[:3]
+    casterBounds = numpy.asarray(casterBounds, dtype=numpy.float32)
+    nearest = numpy.linalg.norm(numpy.maximum(numpy.maximum(casterBounds[0] - position, position - casterBounds[1]), 0))
+    farthest = numpy.linalg.norm(numpy.maximum(numpy.abs(casterBounds[0] - position), numpy.abs(casterBounds[1] - position)))
+    far = max(float(farthest), MIN_NEAR * 2)
+    # the nearest point may be on an edge of the frustum : depth >= distance / sqrt(3)
+    near = min(max(float(nearest) / math.sqrt(3.0), MIN_NEAR), far * 0.5)
+    return perspective(90.0, 1.0, near, far)
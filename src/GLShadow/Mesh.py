@@ -0,0 +1,87 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+from vispy import gloo
+import numpy
+
+from GLShadow.MeshCache import computeBounds
+from GLShadow.EdgeAdjacency import EdgeAdjacency
+
+
+class Mesh(object):
+    """ Geometry of a SceneObject : arrays and their GPU buffers.
+    A Mesh can be shared by several SceneObjects (see MeshRegistry), the
+    buffers are then uploaded only once."""
+    def __init__(self, vertices, indices, normals, texcoord=None, name=None, bounds=None):
+        self._name = name
+        self._vertices = numpy.array(vertices, dtype=numpy.float32)
+        if texcoord is not None:
+            self._texcoord = numpy.array(numpy.asarray(texcoord)[:, 1::-1], dtype=numpy.float32)
+        else:
+            self._texcoord = None
+        # faces may be a list of lists or a (N, 3) array : keep a flat index
+        # list, 16 bits while they can address every vertex
+        indexType = numpy.uint16 if self._vertices.shape[0] <= 65536 else numpy.uint32
+        self._indices = numpy.array(numpy.asarray(indices).ravel(), dtype=indexType)
+        self._normals = numpy.array(normals, dtype=numpy.float32)
+        if bounds is None:
+            bounds = computeBounds(self._vertices)
+        self._bounds = numpy.array(bounds, dtype=numpy.float32)
+        self._vertexBuffer = None
+        self._indexBuffer = None
+        self._normalBuffer = None
+        self._texcoordBuffer = None
+        self._adjacency = None
+
+    def getName(self):
+        """ asset path of the mesh, None for generated meshes """
+        return self._name
+
+    def getBounds(self):
+        """ [[minX, minY, minZ], [maxX, maxY, maxZ]] in object space """
+        return self._bounds
+
+    def getVertices(self):
+        return self._vertices
+
+    def getVertexBuffer(self):
+        if not self._vertexBuffer:
+            self._vertexBuffer = gloo.VertexBuffer(self.getVertices())
+        return self._vertexBuffer
+
+    def getIndices(self):
+        return self._indices
+
+    def getIndexBuffer(self):
+        if not self._indexBuffer:
+            self._indexBuffer = gloo.IndexBuffer(self.getIndices())
+        return self._indexBuffer
+
+    def getNormals(self):
+        return self._normals
+
+    def getNormalBuffer(self):
+        if not self._normalBuffer:
+            self._normalBuffer = gloo.VertexBuffer(self.getNormals())
+        return self._normalBuffer
+
+    def getTexCoords(self):
+        return self._texcoord
+
+    def getTexBuffer(self):
+        if not self._texcoordBuffer:
+            self._texcoordBuffer = gloo.VertexBuffer(self.getTexCoords())
+        return self._texcoordBuffer
+
+    def getAdjacency(self):
+        """ EdgeAdjacency of the mesh, built on first use """
+        if self._adjacency is None:
+            self._adjacency = EdgeAdjacency.forMesh(self)
+        return self._adjacency
+
+    def releaseBuffers(self):
+        """ forget the GPU buffers (they belong to one GL context) """
+        self._vertexBuffer = None
+        self._indexBuffer = None
+        self._normalBuffer = None
+        self._texcoordBuffer = None
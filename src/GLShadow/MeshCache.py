@@ -0,0 +1,146 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import numpy
+
+
+class MeshCache(object):
+    """ On-disk cache of a parsed mesh.
+    Every array is stored as a .npy file next to a small json description, so a
+    warm load is only a memory-mapping of the files. The cache entry is keyed on
+    the source path, its modification time and its size : it is invalidated as
+    soon as the OBJ file changes. When a parser is given, the entry must also
+    have been written by this parser (their normals may differ)."""
+    VERSION = 1
+    ARRAYS = ["vertices", "faces", "normals", "texcoords"]
+
+    def __init__(self, sourceFile, cachePath, parser=None):
+        self._sourceFile = sourceFile
+        self._cachePath = cachePath
+        self._parser = parser
+        self._baseName = cachePath + sourceFile.split("/")[-1]
+
+    def getMetaFile(self):
+        """ """
+        return self._baseName + ".json"
+
+    def getArrayFile(self, name):
+        """ """
+        return self._baseName + "." + name + ".npy"
+
+    def _sourceKey(self):
+        """ identity of the source file : path, mtime and size """
+        stat = os.stat(self._sourceFile)
+        return {"source": self._sourceFile, "mtime": stat.st_mtime, "size": stat.st_size}
+
+    def isValid(self):
+        """ True if the cache entry exists and matches the source file """
+        return self._readMeta() is not None
+
+    def _readMeta(self):
+        """ return the json description or None if missing or outdated """
+        if not os.path.isfile(self.getMetaFile()):
+            return None
+        try:
+            with open(self.getMetaFile(), "r") as metaFile:
+                meta = json.load(metaFile)
+        except ValueError:
+            return None
+        if meta.get("version") != MeshCache.VERSION:
+            return None
+        key = self._sourceKey()
+        for name in key:
+            if meta.get(name) != key[name]:
+                return None
+        if self._parser is not None and meta.get("parser") != self._parser:
+            return None
+        return meta
+
+    def load(self):
+        """ Memory-map the cached arrays.
+        Return a dictionnary (arrays + "bounds") or None on a cache miss"""
+        meta = self._readMeta()
+        if meta is None:
+            return None
+        ret = {}
+        try:
+            for name in MeshCache.ARRAYS:
+                if meta["arrays"][name]:
+                    ret[name] = numpy.load(self.getArrayFile(name), mmap_mode="r")
+                else:
+                    ret[name] = None
+        except (IOError, ValueError, KeyError):
+            return None
+        ret["bounds"] = numpy.array(meta["bounds"], dtype=numpy.float32)
+        return ret
+
+    def store(self, vertices, faces, normals, texcoords):
+        """ Write the arrays in the cache. Return the bounds of the mesh """
+        if not os.path.isdir(self._cachePath):
+            try:
+                os.makedirs(self._cachePath)
+            except OSError:
+                # created in the meantime by another loader
+                if not os.path.isdir(self._cachePath):
+                    raise
+        arrays = {"vertices": vertices, "faces": faces, "normals": normals, "texcoords": texcoords}
+        bounds = computeBounds(vertices)
+        # the description is written last : it marks the entry as complete
+        meta = self._sourceKey()
+        meta["version"] = MeshCache.VERSION
+        meta["parser"] = self._parser
+        meta["bounds"] = bounds.tolist()
+        meta["arrays"] = {}
+        for name in MeshCache.ARRAYS:
+            meta["arrays"][name] = arrays[name] is not None
+            if arrays[name] is not None:
+                self._atomicWrite(self.getArrayFile(name),
+                                  lambda f, a=arrays[name]: numpy.save(f, numpy.ascontiguousarray(a)))
+        self._atomicWrite(self.getMetaFile(), lambda f: json.dump(meta, f))
+        return bounds
+
+    def loadExtra(self, name):
+        """ Memory-map an array derived from the mesh (see storeExtra), None if missing """
+        meta = self._readMeta()
+        if meta is None or name not in meta.get("extras", []):
+            return None
+        try:
+            return numpy.load(self.getArrayFile(name), mmap_mode="r")
+        except (IOError, ValueError):
+            return None
+
+    def storeExtra(self, name, array):
+        """ Add an array derived from the mesh to the entry. It is dropped with
+        the entry when the source changes. Return False if there is no valid entry"""
+        meta = self._readMeta()
+        if meta is None:
+            return False
+        self._atomicWrite(self.getArrayFile(name), lambda f: numpy.save(f, numpy.ascontiguousarray(array)))
+        meta["extras"] = sorted(set(meta.get("extras", []) + [name]))
+        self._atomicWrite(self.getMetaFile(), lambda f: json.dump(meta, f))
+        return True
+
+    def _atomicWrite(self, filename, writer):
+        """ write in a temporary file then rename it, so a reader never sees half a file """
+        tmpName = "%s.%d.tmp" % (filename, os.getpid())
+        with open(tmpName, "wb") as tmpFile:
+            writer(tmpFile)
+        os.rename(tmpName, filename)
+
+
+def getMeshCache(sourceFile, parser=None):
+    """ MeshCache of an asset file, in the cache/ tree used by ObjParser """
+    filePath = "/".join(sourceFile.split("/")[:-1])
+    if len(filePath) > 0 and filePath[-1] != "/":
+        filePath += "/"
+    return MeshCache(sourceFile, filePath.replace("assets/", "cache/", 1), parser)
+
+
+def computeBounds(vertices):
+    """ Axis aligned bounding box of vertices as [[minX, minY, minZ], [maxX, maxY, maxZ]] """
+    vertices = numpy.asarray(vertices, dtype=numpy.float32)
+    if len(vertices) == 0:
+        return numpy.zeros((2, 3), dtype=numpy.float32)
+    return numpy.array([vertices.min(axis=0)[:3], vertices.max(axis=0)[:3]], dtype=numpy.float32)
@@ -0,0 +1,72 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+import threading
+
+from GLShadow.Mesh import Mesh
+from GLShadow.ObjParser import ObjParser
+from GLShadow.SceneObject import SceneObject
+
+
+class MeshRegistry(object):
+    """ Reference counted meshes keyed by asset path.
+    Every instance of the same OBJ file shares one Mesh : the file is parsed
+    once and its vertex, normal, index and texcoord buffers are uploaded once.
+    A mesh is forgotten when its last instance is released."""
+    def __init__(self):
+        self._meshes = {}
+        self._counts = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, filename, parser=None):
+        """ Return the mesh of filename and increment its count.
+        parser is an already loaded ObjParser to use if the mesh is not known yet"""
+        self.lock.acquire()
+        try:
+            if filename not in self._meshes:
+                if parser is None:
+                    parser = ObjParser(filename)
+                self._meshes[filename] = Mesh(parser.getVertices(), parser.getFaces(), parser.getNormals(),
+                                              parser.getTextureCoords(), filename, parser.getBounds())
+                self._counts[filename] = 0
+            self._counts[filename] += 1
+            return self._meshes[filename]
+        finally:
+            self.lock.release()
+
+    def release(self, mesh):
+        """ Decrement the count of mesh, forget it (and its buffers) at zero """
+        filename = mesh.getName()
+        self.lock.acquire()
+        try:
+            if filename not in self._meshes or self._meshes[filename] is not mesh:
+                return
+            self._counts[filename] -= 1
+            if self._counts[filename] <= 0:
+                del self._meshes[filename]
+                del self._counts[filename]
+                mesh.releaseBuffers()
+        finally:
+            self.lock.release()
+
+    def contains(self, filename):
+        """ """
+        return filename in self._meshes
+
+    def getCount(self, filename):
+        """ number of instances using the mesh of filename """
+        return self._counts.get(filename, 0)
+
+    def createObject(self, filename, position, color=None, texture=None, parser=None):
+        """ New SceneObject sharing the mesh of filename """
+        mesh = self.acquire(filename, parser)
+        return SceneObject(None, None, None, position, color, texture, mesh=mesh)
+
+    def releaseObject(self, obj):
+        """ Release the mesh of a SceneObject created by createObject """
+        if obj.getMesh().getName() is not None:
+            self.release(obj.getMesh())
+
+
+# registry shared by the whole application
+meshRegistry = MeshRegistry()
@@ -3,13 +3,27 @@
 
 
 import os
+import time
 
 from vispy.io import imread, read_mesh, load_data_file
 
+from GLShadow.MeshCache import MeshCache, computeBounds
+from GLShadow.StreamObjParser import StreamObjParser
+
+# "native" : chunked vectorized parser, "vispy" : vispy.io.read_mesh
+PARSER_POSSIBILITY = ["native", "vispy"]
+DEFAULT_PARSER = "native"
+
  
 class ObjParser:
-    def __init__(self, filename):
-        """Loads a Wavefront OBJ file. """
+    def __init__(self, filename, useCache=True, parser=DEFAULT_PARSER):
+        """Loads a Wavefront OBJ file.
+        When useCache is set, the parsed arrays are kept in cache/ (same tree
+        as assets/) and memory-mapped on the next loads."""
+        if parser not in PARSER_POSSIBILITY:
+            raise ValueError("Unknown OBJ parser : " + str(parser))
+        self._parser = parser
+        self._throughput = None
 
         self._filePath = "/".join(filename.split("/")[:-1])
         filename = filename.split("/")[-1]
@@ -21,10 +35,16 @@ class ObjParser:
         self._normals = []
         self._textureCoords = []
         self._faces = []
+        self._bounds = None
         self._mtl = None
+        self._fromCache = False
         try:
             if os.path.isfile(self._filePath + filename):
-                self._parseObjFile(filename)
+                if useCache:
+                    self._loadCachedObjFile(filename)
+                else:
+                    self._parseObjFile(filename)
+                    self._bounds = computeBounds(self._vertices)
             else:
                 raise IOError("File does not exist")
         except Exception, e:
@@ -46,9 +66,60 @@ class ObjParser:
     def getMtl(self):
         return self._mtl
 
+    def getBounds(self):
+        """ [[minX, minY, minZ], [maxX, maxY, maxZ]] of the vertices """
+        return self._bounds
+
+    def getParseThroughput(self):
+        """ MB/s of the last text parse, None if the mesh came from the cache """
+        return self._throughput
+
+    def isFromCache(self):
+        """ True if the mesh was memory-mapped from the cache """
+        return self._fromCache
+
+    def _loadCachedObjFile(self, filename):
+        """ Use the cache entry if it is up to date, parse and fill the cache otherwise """
+        cache = MeshCache(self._filePath + filename, self._cachePath, self._parser)
+        cached = cache.load()
+        if cached is None:
+            self._parseObjFile(filename)
+            try:
+                self._bounds = cache.store(self._vertices, self._faces, self._normals, self._textureCoords)
+            except (IOError, OSError), e:
+                print("[WARNING] Unable to write mesh cache : " + str(e))
+                self._bounds = computeBounds(self._vertices)
+        else:
+            self._vertices = cached["vertices"]
+            self._faces = cached["faces"]
+            self._normals = cached["normals"]
+            self._textureCoords = cached["texcoords"]
+            self._bounds = cached["bounds"]
+            self._fromCache = True
+
     def _parseObjFile(self, filename):
         """ """
-        self._vertices, self._faces, self._normals, self._textureCoords = read_mesh(self._filePath + filename)
-        
+        path = self._filePath + filename
+        parser = self._parser
+        start = time.time()
+        if parser == "native":
+            try:
+                self._vertices, self._faces, self._normals, self._textureCoords = StreamObjParser(path).read()
+            except ValueError, e:
+                print("[WARNING] Native OBJ parser failed (" + str(e) + "), using vispy")
+                parser = "vispy"
+                start = time.time()
+        if parser == "vispy":
+            self._vertices, self._faces, self._normals, self._textureCoords = read_mesh(path)
+        elapsed = max(time.time() - start, 1e-6)
+        self._throughput = os.path.getsize(path) / (1024.0 * 1024.0) / elapsed
 
 
+if __name__ == '__main__':
+    # parse speed of each parser on the files given
+    import sys
+    for filename in sys.argv[1:]:
+        for parser in PARSER_POSSIBILITY:
+            obj = ObjParser(filename, useCache=False, parser=parser)
+            print("%s : %s in %.1f MB/s, %d vertices, %d triangles" % (filename, parser, obj.getParseThroughput(),
+                                                                       len(obj.getVertices()), len(obj.getFaces())))
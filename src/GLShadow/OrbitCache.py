@@ -0,0 +1,79 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+import math
+from collections import OrderedDict
+
+from GLShadow.Light import Light
+
+
+def orbitKey(position, step=1.0):
+    """ Key of a light position on its orbit around the y axis (see
+    Light.incrementeRotate) : the angle rounded to step degrees, the radius
+    and the height. The positions of a rotating light come back every turn,
+    so they always fall in the same keys."""
+    x, y, z = position[0], position[1], position[2]
+    theta = math.atan2(z, x) * Light.RATIO_DEGREE_RADIAN
+    nbSteps = int(round(360.0 / step))
+    return (int(round(theta / step)) % nbSteps, round(math.hypot(x, z), 3), round(y, 3))
+
+
+class OrbitCache(object):
+    """ Least recently used cache of the shadow data computed for a light
+    position (volume buffers, shadow map textures...), limited by the size of
+    its entries in bytes. A light rotating around a static scene only costs a
+    lookup per frame once it made one turn.
+    release is called on the values dropped (GL objects to delete)."""
+    def __init__(self, capacity, step=1.0, release=None):
+        self._capacity = capacity
+        self._release = release
+        self._step = step
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def key(self, position, *extra):
+        """ cache key of a light position, extra being what else the entry depends on """
+        return extra + orbitKey(position, self._step)
+
+    def get(self, key):
+        """ the value of key or None """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._entries[key] = entry
+        return entry[0]
+
+    def put(self, key, value, size):
+        """ add an entry of size bytes, dropping the least recently used ones """
+        if key in self._entries:
+            oldValue, oldSize = self._entries.pop(key)
+            self._size -= oldSize
+            self._drop(oldValue)
+        if size > self._capacity:
+            self._drop(value)
+            return
+        self._entries[key] = (value, size)
+        self._size += size
+        while self._size > self._capacity:
+            oldKey, (oldValue, oldSize) = self._entries.popitem(last=False)
+            self._size -= oldSize
+            self._drop(oldValue)
+
+    def _drop(self, value):
+        """ """
+        if self._release is not None:
+            self._release(value)
+
+    def clear(self):
+        """ """
+        for value, size in self._entries.values():
+            self._drop(value)
+        self._entries.clear()
+        self._size = 0
+
+    def getSize(self):
+        """ bytes used by the entries """
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,49 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+import numpy
+
+
+class SceneBatch(object):
+    """ Positions, normals and indices of several objects merged in world space,
+    built with bulk NumPy operations. Each object owns a slice of the arrays,
+    so that a pass can draw a subset of the objects (see getIndexRange())."""
+    def __init__(self, objects=None):
+        self._slices = {}  # id(obj) -> [obj, firstVertex, nbVertices, firstIndex, nbIndices]
+        self._positions = numpy.zeros((0, 3), dtype=numpy.float32)
+        self._normals = numpy.zeros((0, 3), dtype=numpy.float32)
+        self._indices = numpy.zeros(0, dtype=numpy.uint32)
+        if objects:
+            self._build(objects)
+
+    def _build(self, objects):
+        """ merge all objects with bulk operations """
+        counts = numpy.array([len(obj.getVertices()) for obj in objects], dtype=numpy.intp)
+        indexCounts = numpy.array([len(obj.getIndices()) for obj in objects], dtype=numpy.intp)
+        firsts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+        indexFirsts = numpy.concatenate(([0], numpy.cumsum(indexCounts)[:-1]))
+        self._positions = numpy.concatenate([obj.getVertices()[:, :3] for obj in objects]).astype(numpy.float32)
+        self._positions += numpy.repeat(numpy.array([obj.getPosition() for obj in objects],
+                                                    dtype=numpy.float32).reshape((-1, 3)), counts, axis=0)
+        self._normals = numpy.concatenate([obj.getNormals()[:, :3] for obj in objects]).astype(numpy.float32)
+        self._indices = numpy.concatenate([obj.getIndices() for obj in objects]).astype(numpy.uint32)
+        self._indices += numpy.repeat(firsts, indexCounts).astype(numpy.uint32)
+        for i in range(len(objects)):
+            self._slices[id(objects[i])] = [objects[i], firsts[i], counts[i], indexFirsts[i], indexCounts[i]]
+
+    def getPositions(self):
+        """ (n, 3) float32 world space positions """
+        return self._positions
+
+    def getNormals(self):
+        """ (n, 3) float32 normals """
+        return self._normals
+
+    def getIndices(self):
+        """ (n,) uint32 indices """
+        return self._indices
+
+    def getIndexRange(self, obj):
+        """ (first index, number of indices) of obj in the index array """
+        entry = self._slices[id(obj)]
+        return entry[3], entry[4]
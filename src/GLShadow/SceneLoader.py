@@ -0,0 +1,72 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import time
+
+from GLShadow.ObjParser import ObjParser, DEFAULT_PARSER
+from GLShadow.MeshCache import getMeshCache
+
+
+def _parseInWorker(filename):
+    """ Worker : parse the OBJ file and write it in the mesh cache.
+    Only the name goes back to the parent, the arrays are shared through the
+    memory-mapped cache files instead of being pickled."""
+    ObjParser(filename)
+    return filename
+
+
+class SceneLoader(object):
+    """ Load all the meshes of a scene.
+    Meshes missing from the cache are parsed in a pool of processes, so the
+    loading time is the one of the slowest mesh instead of the sum of all of
+    them. The parent process then only memory-maps the cached arrays."""
+    def __init__(self, processes=None):
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self._processes = max(1, processes)
+        self._elapsed = 0
+
+    def getElapsed(self):
+        """ duration of the last load """
+        return self._elapsed
+
+    def load(self, filenames):
+        """ Return a dictionnary filename -> ObjParser, each file is parsed once """
+        start = time.time()
+        uniqueNames = []
+        for filename in filenames:
+            if filename not in uniqueNames:
+                uniqueNames.append(filename)
+        missing = [filename for filename in uniqueNames if not self._isCached(filename)]
+        if len(missing) > 1 and self._processes > 1:
+            self._parallelParse(missing)
+        parsers = {}
+        for filename in uniqueNames:
+            parsers[filename] = ObjParser(filename)
+        self._elapsed = time.time() - start
+        return parsers
+
+    def _isCached(self, filename):
+        """ True if the cache entry of filename is up to date """
+        try:
+            return getMeshCache(filename, DEFAULT_PARSER).isValid()
+        except OSError:
+            return False
+
+    def _parallelParse(self, filenames):
+        """ fill the cache for filenames, in parallel """
+        pool = None
+        try:
+            pool = multiprocessing.Pool(min(self._processes, len(filenames)))
+            # map_async + get keep the parent interruptible under python 2
+            pool.map_async(_parseInWorker, filenames).get(3600)
+            pool.close()
+        except Exception, e:
+            # the serial load done by the caller will report the real error
+            print("[WARNING] Parallel loading failed : " + str(e))
+            if pool:
+                pool.terminate()
+        finally:
+            if pool:
+                pool.join()
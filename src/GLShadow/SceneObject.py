@@ -5,65 +5,58 @@ from vispy import gloo
 from vispy.geometry import *
 import numpy
 
+from GLShadow.Mesh import Mesh
+
 class SceneObject:
-    def __init__(self, vertices, indices, normals, position, color=None, texture=None, texcoord = None, outline = None, visible = True):
-        self._vertices = numpy.array(vertices).astype(numpy.float32)
-        if texcoord != None:
-            self._texcoord = [[x[1], x[0]] for x in texcoord]
-            self._texcoord = numpy.array(self._texcoord).astype(numpy.float32)
-        else:
-            self._texcoord = None
-        try:
-            self._indices = [item for sublist in indices for item in sublist]
-        except:
-            self._indices = indices
-        self._indices = numpy.array(self._indices).astype(numpy.uint16)
-        self._normals = numpy.array(normals).astype(numpy.float32)
+    def __init__(self, vertices, indices, normals, position, color=None, texture=None, texcoord = None, outline = None, visible = True, mesh = None,
+                 castsShadow = True, receivesShadow = True):
+        # the geometry may be shared with other objects : only the position,
+        # the color and the texture belong to this instance
+        if mesh is None:
+            mesh = Mesh(vertices, indices, normals, texcoord)
+        self._mesh = mesh
         self._position = position
         self._color = color
         self._texture = texture
         self._outline = outline
         self._visible = visible
-        self._vertexBuffer = None
-        self._indexBuffer = None
-        self._normalBuffer = None
-        self._texcoordBuffer = None
+        # "casts_shadow" / "receives_shadow" of the scene files
+        self._castsShadow = castsShadow
+        self._receivesShadow = receivesShadow
+
+    def getMesh(self):
+        return self._mesh
 
     def getVertices(self):
-        return self._vertices
+        return self._mesh.getVertices()
 
     def getVertexBuffer(self):
-        if not self._vertexBuffer:
-            self._vertexBuffer = gloo.VertexBuffer(self.getVertices())
-        return self._vertexBuffer
+        return self._mesh.getVertexBuffer()
 
     def getIndices(self):
-        return self._indices
+        return self._mesh.getIndices()
 
     def getIndexBuffer(self):
-        if not self._indexBuffer:
-            self._indexBuffer = gloo.IndexBuffer(self.getIndices())
-        return self._indexBuffer
+        return self._mesh.getIndexBuffer()
 
     def getNormals(self):
-        return self._normals
+        return self._mesh.getNormals()
 
     def getNormalBuffer(self):
-        if not self._normalBuffer:
-            self._normalBuffer = gloo.VertexBuffer(self.getNormals())
-        return self._normalBuffer
+        return self._mesh.getNormalBuffer()
 
     def getTexCoords(self):
-        return self._texcoord
+        return self._mesh.getTexCoords()
 
     def getTexBuffer(self):
-        if not self._texcoordBuffer:
-            self._texcoordBuffer = gloo.VertexBuffer(self.getTexCoords())
-        return self._texcoordBuffer
+        return self._mesh.getTexBuffer()
 
     def getPosition(self):
         return self._position
 
+    def setPosition(self, position):
+        self._position = position
+
     def getPositionHomogeneous(self):
         return self._position + [0]
 
@@ -82,6 +75,18 @@ class SceneObject:
     def isVisible(self):
         return self._visible
 
+    def castsShadow(self):
+        return self._castsShadow
+
+    def setCastsShadow(self, state):
+        self._castsShadow = state
+
+    def receivesShadow(self):
+        return self._receivesShadow
+
+    def setReceivesShadow(self, state):
+        self._receivesShadow = state
+
 if __name__ == '__main__':
     V, F, O = create_cube()
     vertices = [x[0] for x in V]
@@ -92,4 +97,4 @@ if __name__ == '__main__':
     obj = SceneObject(vertices, indices, normals, position, color)
     print obj.getVertices()
     print obj.getIndices()
-    print obj.getNormals()
\ No newline at end of file
+    print obj.getNormals()
@@ -0,0 +1,135 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+from OpenGL import GL
+
+from GLShadow.DepthMap import DepthMap, powerOfTwo
+
+# smallest tile given to a shadow map before it is dropped
+MIN_TILE_SIZE = 64
+
+
+def mortonDecode(index):
+    """ (x, y) of the index-th cell of a Z order curve """
+    x, y, bit = 0, 0, 0
+    while index:
+        x |= (index & 1) << bit
+        y |= ((index >> 1) & 1) << bit
+        index >>= 2
+        bit += 1
+    return x, y
+
+
+def blitDepth(source, sourceOrigin, target, targetOrigin, size):
+    """ copy a size x size square of depth between two DepthMaps """
+    previous = int(GL.glGetIntegerv(GL.GL_FRAMEBUFFER_BINDING))
+    scissor = GL.glIsEnabled(GL.GL_SCISSOR_TEST)
+    GL.glDisable(GL.GL_SCISSOR_TEST)
+    GL.glBindFramebuffer(GL.GL_READ_FRAMEBUFFER, source.getFrameBuffer())
+    GL.glBindFramebuffer(GL.GL_DRAW_FRAMEBUFFER, target.getFrameBuffer())
+    sx, sy = sourceOrigin
+    tx, ty = targetOrigin
+    GL.glBlitFramebuffer(sx, sy, sx + size, sy + size, tx, ty, tx + size, ty + size,
+                         GL.GL_DEPTH_BUFFER_BIT, GL.GL_NEAREST)
+    GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, previous)
+    if scissor:
+        GL.glEnable(GL.GL_SCISSOR_TEST)
+
+
+class ShadowAtlas(object):
+    """ Every shadow map of the scene as a square tile of a single depth
+    texture : one framebuffer bind renders all the dirty maps (a viewport
+    and a scissored clear per tile) and the lighting shader samples one
+    texture through the uv rectangle of each map, so the number of maps is
+    not limited by the texture units.
+    Tiles are powers of two : allocate() shrinks the least important maps
+    until they fit, then places them by decreasing size along a Z order
+    curve, which packs power of two squares without holes."""
+    def __init__(self, size, depthFormat="24"):
+        self._size = size
+        self._depthMap = DepthMap(size, depthFormat)
+        self._dropped = 0
+
+    def getSize(self):
+        """ """
+        return self._size
+
+    def getDepthMap(self):
+        """ """
+        return self._depthMap
+
+    def getMemory(self):
+        """ """
+        return self._depthMap.getMemory()
+
+    def allocate(self, requests):
+        """ tiles of the requests [(key, size, importance)] : {key : (x, y,
+        size)} in texels, a key missing if even MIN_TILE_SIZE did not fit """
+        ordered = sorted(requests, key=lambda request: -request[2])
+        sizes = [min(powerOfTwo(request[1]), self._size) for request in ordered]
+        count = len(ordered)
+        # halve the least important maps first
+        while count and sum(size * size for size in sizes[:count]) > self._size * self._size:
+            shrinkable = [j for j in range(count) if sizes[j] > MIN_TILE_SIZE]
+            if shrinkable:
+                sizes[shrinkable[-1]] //= 2
+            else:
+                count -= 1
+        dropped = len(ordered) - count
+        if dropped and dropped != self._dropped:
+            print("[WARNING] shadow atlas full : %d shadow maps dropped" % dropped)
+        self._dropped = dropped
+        tiles = {}
+        offset = 0
+        # same sizes, same places : the tiles only move when a size changes
+        for j in sorted(range(count), key=lambda j: (-sizes[j], ordered[j][0])):
+            size = sizes[j]
+            x, y = mortonDecode(offset // (size * size))
+            tiles[ordered[j][0]] = (x * size, y * size, size)
+            offset += size * size
+        return tiles
+
+    def getRectangle(self, tile):
+        """ (u, v, width, half texel) of a tile in texture coordinates, for
+        the lighting shader """
+        x, y, size = tile
+        return (float(x) / self._size, float(y) / self._size, float(size) / self._size, 0.5 / size)
+
+    def begin(self):
+        """ bind the atlas, the tiles being cleared by beginTile """
+        self._depthMap.begin(clear=False)
+        GL.glEnable(GL.GL_SCISSOR_TEST)
+
+    def beginTile(self, tile):
+        """ render into tile only, cleared """
+        x, y, size = tile
+        GL.glViewport(x, y, size, size)
+        GL.glScissor(x, y, size, size)
+        GL.glClear(GL.GL_DEPTH_BUFFER_BIT)
+
+    def end(self):
+        """ """
+        self._depthMap.end()
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, *args):
+        self.end()
+
+    def bindTexture(self, unit):
+        """ """
+        self._depthMap.bindTexture(unit)
+
+    def copyTile(self, tile, depthMap):
+        """ copy a tile into depthMap (of the tile's size) """
+        blitDepth(self._depthMap, tile[:2], depthMap, (0, 0), tile[2])
+
+    def pasteTile(self, depthMap, tile):
+        """ copy depthMap (of the tile's size) into a tile """
+        blitDepth(depthMap, (0, 0), self._depthMap, tile[:2], tile[2])
+
+    def release(self):
+        """ """
+        self._depthMap.release()
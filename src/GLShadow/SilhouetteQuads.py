@@ -0,0 +1,73 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+from vispy import gloo
+import numpy
+
+# (end of the edge, extruded) of the 6 vertices of a quad : (a, b, c), (a, c, d)
+QUAD_CORNERS = numpy.array([[0, 0], [1, 0], [1, 1], [0, 0], [1, 1], [0, 1]], dtype=numpy.float32)
+# plane of the missing face of a border edge : always lit
+BORDER_PLANE = numpy.array([0, 0, 0, 1], dtype=numpy.float32)
+
+
+class SilhouetteQuads(object):
+    """ Every edge of a mesh as a potential shadow volume quad, for the
+    extrusion in the vertex shader (shaders/shadowvolumegpu.vertexshader).
+    Each vertex carries both ends of its edge and the planes of the two faces,
+    the shader keeps the silhouette edges and extrudes them to infinity. The
+    buffers only depend on the mesh : they are uploaded once."""
+    def __init__(self, vertices, adjacency):
+        positions = numpy.asarray(vertices, dtype=numpy.float32)[:, :3]
+        edges = adjacency.getEdges()
+        planes = adjacency.getPlanes()
+        nbEdges = len(edges)
+        self._arrays = {}
+        self._arrays["position"] = numpy.repeat(positions[edges[:, 0]], 6, axis=0)
+        self._arrays["position_other"] = numpy.repeat(positions[edges[:, 1]], 6, axis=0)
+        self._arrays["corner"] = numpy.tile(QUAD_CORNERS, (nbEdges, 1))
+        self._arrays["plane0"] = numpy.repeat(planes[edges[:, 2]], 6, axis=0)
+        plane1 = numpy.empty((nbEdges, 4), dtype=numpy.float32)
+        plane1[:] = BORDER_PLANE
+        shared = edges[:, 3] >= 0
+        plane1[shared] = planes[edges[shared, 3]]
+        self._arrays["plane1"] = numpy.repeat(plane1, 6, axis=0)
+        self._buffers = None
+
+    @staticmethod
+    def merge(quadsList, translations):
+        """ one SilhouetteQuads of several meshes moved by translations (world
+        space) : the edges are translated and so are the planes of the faces
+        (n.p + d = 0 becomes n.p + d - n.t = 0)"""
+        merged = SilhouetteQuads.__new__(SilhouetteQuads)
+        merged._arrays = {}
+        merged._buffers = None
+        for name in ("position", "position_other", "corner", "plane0", "plane1"):
+            parts = []
+            for quads, translation in zip(quadsList, translations):
+                array = quads._arrays[name]
+                t = numpy.asarray(translation, dtype=numpy.float32)[:3]
+                if name.startswith("position"):
+                    array = array + t
+                elif name.startswith("plane"):
+                    array = array.copy()
+                    array[:, 3] -= array[:, :3].dot(t)
+                parts.append(array)
+            merged._arrays[name] = numpy.concatenate(parts).astype(numpy.float32)
+        return merged
+
+    def __len__(self):
+        """ number of vertices """
+        return len(self._arrays["position"])
+
+    def bind(self, program):
+        """ set the attributes of program, uploading the buffers on first use """
+        if self._buffers is None:
+            self._buffers = {}
+            for name in self._arrays:
+                self._buffers[name] = gloo.VertexBuffer(numpy.ascontiguousarray(self._arrays[name]))
+        for name in self._buffers:
+            program[name] = self._buffers[name]
+
+    def releaseBuffers(self):
+        """ """
+        self._buffers = None
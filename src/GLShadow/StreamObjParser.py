@@ -0,0 +1,297 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import numpy
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+NEWLINE = ord("\n")
+SPACE = ord(" ")
+SLASH = ord("/")
+# bytes considered as separators when counting tokens
+BLANKS = [ord(" "), ord("\t"), ord("\r"), ord("\n")]
+
+
+class StreamObjParser(object):
+    """ Vectorized Wavefront OBJ reader.
+    The file is read by chunks : in each chunk the records are classified with
+    NumPy from the first bytes of every line, and the numbers of all the records
+    of a type are converted in one call. Data is written in preallocated arrays
+    (the first pass only counts the records). Polygons are triangulated as fans
+    and negative (relative) indices are supported.
+    The result has the same layout as vispy.io.read_mesh : one vertex for each
+    distinct v/vt/vn triplet, faces as a (N, 3) uint32 array."""
+    def __init__(self, filename, chunkSize=CHUNK_SIZE):
+        self._filename = filename
+        self._chunkSize = chunkSize
+        self._elapsed = 0
+        self._size = os.path.getsize(filename)
+
+    def getThroughput(self):
+        """ parse speed in MB/s of the last call to read() """
+        if self._elapsed <= 0:
+            return 0
+        return self._size / (1024.0 * 1024.0) / self._elapsed
+
+    def getElapsed(self):
+        """ """
+        return self._elapsed
+
+    def read(self):
+        """ Return vertices, faces, normals, texcoords """
+        start = time.time()
+        nbV, nbVn, nbVt, nbF = self._countRecords()
+        self._v = numpy.empty((nbV, 3), dtype=numpy.float32)
+        self._vn = numpy.empty((nbVn, 3), dtype=numpy.float32)
+        self._vt = numpy.empty((nbVt, 2), dtype=numpy.float32)
+        self._counts = [0, 0, 0]  # v, vt, vn written so far
+        # triangle corners : v, vt, vn index for each of the 3 corners (fan
+        # triangulation of quads gives 2 triangles, grown when needed)
+        self._corners = numpy.empty((max(nbF * 2, 1) * 3, 3), dtype=numpy.uint32)
+        self._nbCorners = 0
+        self._layout = None
+
+        for chunk in self._chunks():
+            self._parseChunk(chunk)
+
+        ret = self._finish()
+        self._elapsed = time.time() - start
+        return ret
+
+    def _chunks(self):
+        """ yield pieces of the file that always end on a line end """
+        rest = ""
+        with open(self._filename, "rb") as objFile:
+            while True:
+                data = objFile.read(self._chunkSize)
+                if not data:
+                    break
+                data = rest + data
+                end = data.rfind("\n")
+                if end < 0:
+                    rest = data
+                    continue
+                rest = data[end + 1:]
+                yield data[:end + 1]
+        if rest:
+            yield rest + "\n"
+
+    def _countRecords(self):
+        """ First pass : number of v, vn, vt and f records """
+        counts = [0, 0, 0, 0]
+        for chunk in self._chunks():
+            chunk = "\n" + chunk
+            counts[0] += chunk.count("\nv ")
+            counts[1] += chunk.count("\nvn ")
+            counts[2] += chunk.count("\nvt ")
+            counts[3] += chunk.count("\nf ")
+        return counts
+
+    def _parseChunk(self, chunk):
+        """ Classify every line of the chunk and parse each kind in bulk """
+        buf = numpy.frombuffer(chunk, dtype=numpy.uint8)
+        newlines = numpy.flatnonzero(buf == NEWLINE)
+        starts = numpy.concatenate(([0], newlines[:-1] + 1))
+        # three first bytes of each line (padded by newlines for short lines)
+        padded = numpy.concatenate((buf, [NEWLINE, NEWLINE, NEWLINE]))
+        first, second, third = padded[starts], padded[starts + 1], padded[starts + 2]
+        isV = (first == ord("v")) & (second == SPACE)
+        isVt = (first == ord("v")) & (second == ord("t")) & (third == SPACE)
+        isVn = (first == ord("v")) & (second == ord("n")) & (third == SPACE)
+        isF = (first == ord("f")) & (second == SPACE)
+        # line of each byte
+        lineOfByte = numpy.zeros(len(buf), dtype=numpy.intp)
+        lineOfByte[newlines[:-1] + 1] = 1
+        lineOfByte = numpy.cumsum(lineOfByte)
+
+        # faces use indices relative to what was read before them
+        vBefore = self._counts[0] + numpy.cumsum(isV) - isV
+        vtBefore = self._counts[1] + numpy.cumsum(isVt) - isVt
+        vnBefore = self._counts[2] + numpy.cumsum(isVn) - isVn
+
+        self._counts[0] = self._storeFloats(buf, starts, lineOfByte, isV, 2, self._v, self._counts[0])
+        self._counts[1] = self._storeFloats(buf, starts, lineOfByte, isVt, 3, self._vt, self._counts[1])
+        self._counts[2] = self._storeFloats(buf, starts, lineOfByte, isVn, 3, self._vn, self._counts[2])
+        if isF.any():
+            self._storeFaces(buf, starts, lineOfByte, isF,
+                             vBefore[isF], vtBefore[isF], vnBefore[isF])
+
+    def _recordBytes(self, buf, starts, lineOfByte, mask, prefixLength):
+        """ bytes of all the lines selected by mask, with the record keyword blanked """
+        data = buf[mask[lineOfByte]].copy()
+        lineStarts = numpy.cumsum(numpy.bincount(lineOfByte, minlength=len(starts))[mask])
+        lineStarts = numpy.concatenate(([0], lineStarts[:-1]))
+        for i in range(prefixLength):
+            data[lineStarts + i] = SPACE
+        return data, lineStarts
+
+    def _tokensPerLine(self, data, lineStarts):
+        """ number of blank separated tokens on each line of data """
+        blank = numpy.in1d(data, BLANKS)
+        tokenStart = ~blank & numpy.concatenate(([True], blank[:-1]))
+        counts = numpy.add.reduceat(tokenStart.astype(numpy.intp), lineStarts) if len(lineStarts) else numpy.zeros(0, numpy.intp)
+        return counts
+
+    def _storeFloats(self, buf, starts, lineOfByte, mask, prefixLength, out, offset):
+        """ parse the selected records and write them in out[offset:] """
+        nbLines = int(mask.sum())
+        if nbLines == 0:
+            return offset
+        data, lineStarts = self._recordBytes(buf, starts, lineOfByte, mask, prefixLength)
+        values = numpy.fromstring(data.tostring(), dtype=numpy.float32, sep=" ")
+        width = out.shape[1]
+        if len(values) == nbLines * width:
+            out[offset:offset + nbLines] = values.reshape((nbLines, width))
+        else:
+            # records with extra (w, colors) or missing components
+            counts = self._tokensPerLine(data, lineStarts)
+            if len(values) != counts.sum():
+                raise ValueError("Malformed numeric record in " + self._filename)
+            firsts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+            for component in range(width):
+                has = counts > component
+                column = numpy.zeros(nbLines, dtype=numpy.float32)
+                column[has] = values[firsts[has] + component]
+                out[offset:offset + nbLines, component] = column
+        return offset + nbLines
+
+    def _storeFaces(self, buf, starts, lineOfByte, mask, vBefore, vtBefore, vnBefore):
+        """ triangulate the selected face records and append their corners """
+        data, lineStarts = self._recordBytes(buf, starts, lineOfByte, mask, 1)
+        cornersPerFace = self._tokensPerLine(data, lineStarts)
+        layout = self._faceLayout(data)
+        isSlash = data == SLASH
+        data[isSlash] = SPACE
+        values = numpy.fromstring(data.tostring(), dtype=numpy.int64, sep=" ")
+        fields = sum(layout)
+        if len(values) != cornersPerFace.sum() * fields:
+            raise ValueError("Faces of " + self._filename + " mix several v/vt/vn layouts")
+        values = values.reshape((-1, fields))
+
+        # absolute, 0 based, v/vt/vn indices of each corner
+        corners = numpy.zeros((len(values), 3), dtype=numpy.int64)
+        cornerFace = numpy.repeat(numpy.arange(len(cornersPerFace)), cornersPerFace)
+        column = 0
+        for field, before in enumerate([vBefore, vtBefore, vnBefore]):
+            if layout[field]:
+                index = values[:, column]
+                corners[:, field] = numpy.where(index < 0, index + before[cornerFace], index - 1)
+                column += 1
+
+        # fan triangulation : (0, k, k+1) for k in 1..n-2
+        trianglesPerFace = numpy.maximum(cornersPerFace - 2, 0)
+        nbTriangles = int(trianglesPerFace.sum())
+        firstCorner = numpy.concatenate(([0], numpy.cumsum(cornersPerFace)[:-1]))
+        triangleFace = numpy.repeat(numpy.arange(len(cornersPerFace)), trianglesPerFace)
+        k = numpy.arange(nbTriangles) - numpy.repeat(numpy.cumsum(trianglesPerFace) - trianglesPerFace, trianglesPerFace) + 1
+        base = firstCorner[triangleFace]
+        triangles = numpy.empty((nbTriangles, 3), dtype=numpy.intp)
+        triangles[:, 0] = base
+        triangles[:, 1] = base + k
+        triangles[:, 2] = base + k + 1
+
+        self._reserveCorners(nbTriangles * 3)
+        self._corners[self._nbCorners:self._nbCorners + nbTriangles * 3] = corners[triangles.ravel()]
+        self._nbCorners += nbTriangles * 3
+
+    def _faceLayout(self, data):
+        """ (has v, has vt, has vn) from the first corner of the chunk """
+        text = data[:256].tostring().split()[0]
+        parts = text.split("/")
+        layout = (True, len(parts) > 1 and parts[1] != "", len(parts) > 2 and parts[2] != "")
+        if self._layout is not None and self._layout != layout:
+            raise ValueError("Faces of " + self._filename + " mix several v/vt/vn layouts")
+        self._layout = layout
+        return layout
+
+    def _reserveCorners(self, needed):
+        """ amortized growth of the corner array """
+        if self._nbCorners + needed <= len(self._corners):
+            return
+        capacity = max(len(self._corners) * 2, self._nbCorners + needed)
+        grown = numpy.empty((capacity, 3), dtype=numpy.uint32)
+        grown[:self._nbCorners] = self._corners[:self._nbCorners]
+        self._corners = grown
+
+    def _finish(self):
+        """ build one vertex per distinct v/vt/vn triplet, in first use order """
+        v = self._v[:self._counts[0]]
+        vt = self._vt[:self._counts[1]]
+        vn = self._vn[:self._counts[2]]
+        if self._nbCorners == 0:
+            return v, None, self._computeNormals(v, None), None
+        corners = self._corners[:self._nbCorners]
+        if corners[:, 0].max() >= len(v) or (self._layout[1] and corners[:, 1].max() >= len(vt)) \
+                or (self._layout[2] and corners[:, 2].max() >= len(vn)):
+            raise ValueError("Face index out of range in " + self._filename)
+
+        keys = corners.astype(numpy.int64)
+        keys = (keys[:, 0] * (len(vt) + 1) + keys[:, 1]) * (len(vn) + 1) + keys[:, 2]
+        uniqueKeys, firstUse, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+        order = numpy.argsort(firstUse)
+        rank = numpy.empty(len(order), dtype=numpy.uint32)
+        rank[order] = numpy.arange(len(order), dtype=numpy.uint32)
+        used = corners[firstUse[order]]
+
+        vertices = v[used[:, 0]]
+        faces = rank[inverse].reshape((-1, 3))
+        texcoords = vt[used[:, 1]] if self._layout[1] else None
+        if self._layout[2]:
+            normals = vn[used[:, 2]]
+        else:
+            normals = self._computeNormals(vertices, faces)
+        return vertices, faces, normals, texcoords
+
+    def _computeNormals(self, vertices, faces):
+        """ vertex normals as vispy computes them : the sum of the unit normals
+        of the adjacent triangles, normalized """
+        normals = numpy.zeros(vertices.shape, dtype=numpy.float64)
+        if faces is None or len(faces) == 0:
+            return normals.astype(numpy.float32)
+        positions = vertices.astype(numpy.float64)
+        a, b, c = positions[faces[:, 0]], positions[faces[:, 1]], positions[faces[:, 2]]
+        faceNormals = numpy.cross(b - a, c - a)
+        norms = numpy.sqrt((faceNormals ** 2).sum(axis=1))
+        norms[norms == 0] = 1
+        faceNormals /= norms[:, numpy.newaxis]
+        for corner in range(3):
+            numpy.add.at(normals, faces[:, corner], faceNormals)
+        norms = numpy.sqrt((normals ** 2).sum(axis=1))
+        norms[norms == 0] = 1
+        return (normals / norms[:, numpy.newaxis]).astype(numpy.float32)
+
+
+if __name__ == '__main__':
+    # self check against vispy's reader : bundled assets (one vertex per
+    # distinct v/vt/vn triplet, normals computed when the file has none) and
+    # two quads (fan triangulation)
+    import tempfile
+    from vispy.io import read_mesh
+
+    def checkAgainstVispy(filename):
+        vertices, faces, normals, texcoords = StreamObjParser(filename).read()
+        expected = read_mesh(filename)
+        expectedFaces = expected[1]
+        if expectedFaces.shape[1] == 4:
+            expectedFaces = numpy.hstack((expectedFaces[:, [0, 1, 2]], expectedFaces[:, [0, 2, 3]])).reshape(-1, 3)
+        assert numpy.array_equal(vertices, expected[0])
+        assert numpy.array_equal(faces, expectedFaces)
+        # computed normals : float64 in vispy
+        assert numpy.allclose(normals, expected[2], atol=1e-6)
+        assert numpy.array_equal(texcoords, expected[3])
+        print("%s : %d vertices, %d triangles" % (filename, len(vertices), len(faces)))
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    checkAgainstVispy(os.path.join(directory, "..", "assets", "obj", "shadow-map-tuto", "room.obj"))
+    checkAgainstVispy(os.path.join(directory, "..", "assets", "obj", "tree-palmier", "FR01b.obj"))
+    quads = tempfile.NamedTemporaryFile(suffix=".obj", delete=False)
+    quads.write("v 0 0 0\nv 1 0 0\nv 1 1 0\nv 0 1 0\nv 2 0 0\nv 2 1 0\n"
+                "vt 0 0\nvt 1 0\nvt 1 1\nvt 0 1\nvn 0 0 1\n"
+                "f 1/1/1 2/2/1 3/3/1 4/4/1\nf 2/1/1 5/2/1 6/3/1 3/4/1\n")
+    quads.close()
+    try:
+        checkAgainstVispy(quads.name)
+    finally:
+        os.remove(quads.name)
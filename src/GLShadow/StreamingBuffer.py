@@ -0,0 +1,147 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+from OpenGL import GL
+from vispy import gloo
+from vispy.gloo.buffer import DataBufferView
+from collections import deque
+import numpy
+
+# nanoseconds waited on a fence between two checks
+FENCE_TIMEOUT = 1000000000
+
+
+class StreamAllocation(object):
+    """ A range of a StreamingBuffer : valid until the ring reuses it """
+    def __init__(self, buffer, start, count, lap, frame):
+        self.buffer = buffer
+        self.start = start
+        self.count = count
+        self.lap = lap
+        self.lastUse = frame
+        self.valid = True
+        # a view not registered in the buffer (registered views are only
+        # released when the buffer is resized)
+        self.view = DataBufferView(buffer, slice(start, start + count))
+
+
+class StreamingBuffer(object):
+    """ Ring of vertices in one vertex buffer for the geometry rebuilt while
+    rendering (shadow volumes...). write() uploads an array at the head of
+    the ring (a sub-range update) and returns its allocation, drawn through
+    allocation.view. An allocation lives until the head comes back to it :
+    the caller writes it again once isValid() is False.
+    Before a range is reused the GPU must be done with the frames that drew
+    it : endFrame() puts a fence after each frame and the oldest fences are
+    waited for if needed. A range still needed by the current frame is never
+    reused, the buffer doubles instead (new allocations, the previous ones
+    become invalid)."""
+    def __init__(self, capacity=65536, dtype=numpy.float32, components=3):
+        self._dtype = [('f0', dtype, components)]
+        self._capacity = 0
+        self._buffer = None
+        self._live = deque()
+        self._head = 0
+        self._lap = 0
+        self._frame = 0
+        self._fences = deque()
+        try:
+            self._fenceSupported = bool(GL.glFenceSync) and bool(GL.glClientWaitSync)
+        except Exception:
+            self._fenceSupported = False
+        self._grow(capacity)
+
+    def getCapacity(self):
+        """ number of vertices """
+        return self._capacity
+
+    def write(self, data):
+        """ upload data ((n, components) array) and return its allocation """
+        data = numpy.ascontiguousarray(data, dtype=self._dtype[0][1])
+        count = len(data)
+        if count > self._capacity or not self._reserve(count):
+            self._grow(max(self._capacity * 2, count * 2))
+            self._reserve(count)
+        allocation = StreamAllocation(self._buffer, self._head, count, self._lap, self._frame)
+        self._buffer.set_subdata(data, offset=self._head)
+        self._head += count
+        self._live.append(allocation)
+        return allocation
+
+    def isValid(self, allocation):
+        """ False once the range of allocation has been reused """
+        return allocation.valid and allocation.buffer is self._buffer
+
+    def use(self, allocation):
+        """ mark allocation as drawn by the current frame, return its view """
+        allocation.lastUse = self._frame
+        return allocation.view
+
+    def endFrame(self):
+        """ fence the commands of the frame and release the finished fences """
+        if self._fenceSupported:
+            self._fences.append((self._frame, GL.glFenceSync(GL.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)))
+            while self._fences:
+                status = GL.glClientWaitSync(self._fences[0][1], 0, 0)
+                if status not in (GL.GL_ALREADY_SIGNALED, GL.GL_CONDITION_SATISFIED):
+                    break
+                GL.glDeleteSync(self._fences.popleft()[1])
+        self._frame += 1
+
+    def release(self):
+        """ drop the buffer and the fences """
+        for frame, fence in self._fences:
+            GL.glDeleteSync(fence)
+        self._fences.clear()
+        for allocation in self._live:
+            allocation.valid = False
+        self._live.clear()
+        self._buffer = None
+
+    def _reserve(self, count):
+        """ free [head, head + count), wrapping if needed. False if this
+        would reuse a range of the current frame """
+        lap, head = self._lap, self._head
+        if head + count > self._capacity:
+            lap, head = lap + 1, 0
+        evicted = 0
+        for allocation in self._live:
+            if allocation.lap == lap or (allocation.lap == lap - 1 and allocation.start >= head + count):
+                break
+            if allocation.lastUse >= self._frame:
+                return False
+            evicted += 1
+        self._lap, self._head = lap, head
+        if evicted:
+            self._waitFrame(max(self._live[j].lastUse for j in range(evicted)))
+        for j in range(evicted):
+            self._live.popleft().valid = False
+        return True
+
+    def _waitFrame(self, frame):
+        """ wait until the GPU finished the commands of frame """
+        if not self._fenceSupported:
+            GL.glFinish()
+            return
+        fence = None
+        while self._fences and self._fences[0][0] <= frame:
+            if fence is not None:
+                GL.glDeleteSync(fence)
+            fence = self._fences.popleft()[1]
+        if fence is None:
+            return
+        while GL.glClientWaitSync(fence, GL.GL_SYNC_FLUSH_COMMANDS_BIT, FENCE_TIMEOUT) == GL.GL_TIMEOUT_EXPIRED:
+            pass
+        GL.glDeleteSync(fence)
+
+    def _grow(self, capacity):
+        """ a new buffer : every allocation becomes invalid """
+        for allocation in self._live:
+            allocation.valid = False
+        self._live.clear()
+        self._capacity = capacity
+        self._buffer = gloo.VertexBuffer(dtype=self._dtype, size=capacity, store=False)
+        # the size given to the constructor is not kept by gloo
+        self._buffer.resize_bytes(capacity * self._buffer.itemsize)
+        self._head = 0
+        self._lap = 0
@@ -0,0 +1,116 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+from OpenGL import GL
+from OpenGL.GL.EXT.depth_bounds_test import glInitDepthBoundsTestEXT, glDepthBoundsEXT, GL_DEPTH_BOUNDS_TEST_EXT
+import numpy
+
+# (i, j, k) : corner (bounds[i][0], bounds[j][1], bounds[k][2])
+CORNERS = numpy.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)])
+
+
+def isDepthBoundsSupported():
+    """ True if GL_EXT_depth_bounds_test is available (needs a current GL context) """
+    try:
+        return bool(glInitDepthBoundsTestEXT())
+    except Exception:
+        return False
+
+
+def setDepthBounds(zNear, zFar):
+    """ discard the fragments where the depth buffer is outside [zNear, zFar],
+    None disables the test """
+    if zNear is None:
+        GL.glDisable(GL_DEPTH_BOUNDS_TEST_EXT)
+    else:
+        GL.glEnable(GL_DEPTH_BOUNDS_TEST_EXT)
+        glDepthBoundsEXT(zNear, zFar)
+
+
+def boxCorners(bounds):
+    """ (8, 3) corners of [[minX, minY, minZ], [maxX, maxY, maxZ]] """
+    bounds = numpy.asarray(bounds, dtype=numpy.float32)
+    return bounds[CORNERS, [0, 1, 2]]
+
+
+def sceneBounds(objects, margin=0.01):
+    """ world space bounds of the objects (translated meshes), enlarged by
+    margin of their size so that the clamped volumes end strictly outside """
+    if not objects:
+        return numpy.zeros((2, 3), dtype=numpy.float32)
+    lows = [obj.getMesh().getBounds()[0] + obj.getPosition() for obj in objects]
+    highs = [obj.getMesh().getBounds()[1] + obj.getPosition() for obj in objects]
+    bounds = numpy.array([numpy.min(lows, axis=0), numpy.max(highs, axis=0)], dtype=numpy.float32)
+    extra = (bounds[1] - bounds[0]).max() * margin + 1e-3
+    bounds[0] -= extra
+    bounds[1] += extra
+    return bounds
+
+
+def coneBounds(objectBounds, lightPosition, scene):
+    """ bounds of the shadow volume of a box, clamped to the scene.
+    A point of the box is extruded at most by diagonal / distance(light, box)
+    before it leaves the scene : the volume is inside the box scaled by that
+    much from the light, plus the box itself"""
+    objectBounds = numpy.asarray(objectBounds, dtype=numpy.float32)
+    light = numpy.asarray(lightPosition, dtype=numpy.float32)[:3]
+    distance = numpy.linalg.norm(numpy.maximum(numpy.maximum(objectBounds[0] - light, light - objectBounds[1]), 0))
+    if distance < 1e-6:
+        # the light is inside the box : it may shadow anything
+        return numpy.array(scene, dtype=numpy.float32)
+    magnitude = numpy.linalg.norm(scene[1] - scene[0]) / distance
+    corners = boxCorners(objectBounds)
+    points = numpy.concatenate((corners, corners + magnitude * (corners - light)))
+    bounds = numpy.array([points.min(axis=0), points.max(axis=0)], dtype=numpy.float32)
+    bounds[0] = numpy.maximum(bounds[0], scene[0])
+    bounds[1] = numpy.minimum(bounds[1], scene[1])
+    return bounds
+
+
+class VolumeCuller(object):
+    """ Camera frustum test of the shadow volume bounds and their window
+    rectangle and depth range, to limit the stencil fill with the scissor
+    and the depth bounds test. Matrices are in the vispy (row vector)
+    convention"""
+    def __init__(self, projection, viewport):
+        self._projection = numpy.asarray(projection, dtype=numpy.float32)
+        self._viewport = viewport
+        self._viewProjection = self._projection
+
+    def setView(self, view):
+        """ """
+        self._viewProjection = numpy.dot(view, self._projection)
+
+    def getViewport(self):
+        """ """
+        return self._viewport
+
+    def project(self, bounds):
+        """ None if the box is outside the frustum, else the window
+        (x, y, width, height, zNear, zFar) covering it : the whole viewport
+        and depth range when a part of the box is behind the camera """
+        corners = numpy.ones((8, 4), dtype=numpy.float32)
+        corners[:, :3] = boxCorners(bounds)
+        clip = numpy.dot(corners, self._viewProjection)
+        w = clip[:, 3:4]
+        if (clip[:, :3] > w).all(axis=0).any() or (clip[:, :3] < -w).all(axis=0).any():
+            return None
+        width, height = self._viewport
+        if (w <= 1e-6).any():
+            return (0, 0, width, height, 0.0, 1.0)
+        ndc = numpy.clip(clip[:, :3] / w, -1.0, 1.0)
+        low = (ndc.min(axis=0) + 1.0) * 0.5
+        high = (ndc.max(axis=0) + 1.0) * 0.5
+        x = int(numpy.floor(low[0] * width))
+        y = int(numpy.floor(low[1] * height))
+        return (x, y, int(numpy.ceil(high[0] * width)) - x, int(numpy.ceil(high[1] * height)) - y,
+                float(low[2]), float(high[2]))
+
+    @staticmethod
+    def union(rectangles):
+        """ window rectangle and depth range covering rectangles """
+        x = min(r[0] for r in rectangles)
+        y = min(r[1] for r in rectangles)
+        right = max(r[0] + r[2] for r in rectangles)
+        top = max(r[1] + r[3] for r in rectangles)
+        return (x, y, right - x, top - y, min(r[4] for r in rectangles), max(r[5] for r in rectangles))
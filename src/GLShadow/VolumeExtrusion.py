@@ -0,0 +1,111 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+
+import numpy
+
+EXTRUDE_MAGNITUDE = 100
+
+
+def extrudeEdges(edges, lightPosition, magnitude=EXTRUDE_MAGNITUDE):
+    """ (6 * n, 3) float32 triangles of the quads (a, b, c, d), c and d being
+    b and a pushed away from the light : triangles (a, b, c) and (a, c, d).
+    magnitude is a scalar or the (n, 2) magnitudes of the two ends """
+    edges = numpy.asarray(edges, dtype=numpy.float32)
+    light = numpy.asarray(lightPosition, dtype=numpy.float32)[:3]
+    a = edges[:, 0]
+    b = edges[:, 1]
+    magnitude = numpy.asarray(magnitude, dtype=numpy.float32)
+    if magnitude.ndim == 2:
+        magnitudeA = magnitude[:, 0:1]
+        magnitudeB = magnitude[:, 1:2]
+    else:
+        magnitudeA = magnitudeB = magnitude
+    triangles = numpy.empty((len(edges), 6, 3), dtype=numpy.float32)
+    triangles[:, 0] = a
+    triangles[:, 1] = b
+    triangles[:, 2] = b + magnitudeB * (b - light)
+    triangles[:, 3] = a
+    triangles[:, 4] = triangles[:, 2]
+    triangles[:, 5] = a + magnitudeA * (a - light)
+    return triangles.reshape((-1, 3))
+
+
+def exitMagnitudes(points, lightPosition, bounds):
+    """ for each point p inside bounds ([[minX, minY, minZ], [maxX, maxY, maxZ]]),
+    the smallest t such that p + t * (p - light) is on the border of bounds """
+    points = numpy.asarray(points, dtype=numpy.float32)
+    light = numpy.asarray(lightPosition, dtype=numpy.float32)[:3]
+    direction = points - light
+    # an axis the ray does not move along never bounds it
+    direction[numpy.abs(direction) < 1e-6] = 1e-6
+    low = (bounds[0] - points) / direction
+    high = (bounds[1] - points) / direction
+    return numpy.maximum(numpy.maximum(low, high).min(axis=-1), 0)
+
+
+def extrudeContour(edges, lightPosition, magnitude=EXTRUDE_MAGNITUDE, bounds=None):
+    """ shadow volume sides of a contour, one array ready for upload.
+    The edges come from ContourEdges, in the winding of their unlit face :
+    the quads already face outward.
+    With bounds (the scene in the space of the edges) each end is only
+    extruded until it leaves them, magnitude being the maximum"""
+    if bounds is not None and len(edges):
+        magnitude = numpy.minimum(exitMagnitudes(edges, lightPosition, bounds), magnitude)
+    return extrudeEdges(edges, lightPosition, magnitude)
+
+
+if __name__ == '__main__':
+    # benchmark against the former per edge implementation, the new one
+    # extruding up to the bounds of the scene as ShadowVolumeAlgorithm does
+    import sys
+    import time
+    from GLShadow.ObjParser import ObjParser
+    from GLShadow.Mesh import Mesh
+    from GLShadow.ContourEdges import ContourEdges
+
+    def legacyExtrude(edges, light):
+        vertices = []
+        size = len(edges)
+        for j in range(size):
+            vertices.extend([numpy.array(vec) for vec in edges[j].tolist()])
+        center = [sum(v[j] for v in vertices)/(size*2) for j in range(3)]
+        lightDir = numpy.subtract(light, center)
+
+        def clockwise(v1, v2):
+            return numpy.dot(lightDir, numpy.cross(numpy.subtract(v1, center), numpy.subtract(v2, center))) >= 0
+
+        for j in range(0, len(vertices), 2):
+            if not clockwise(vertices[j], vertices[j+1]):
+                tmp = vertices[j]
+                vertices[j] = vertices[j+1]
+                vertices[j+1] = tmp
+        newVertices = []
+        for i in range(0, len(vertices), 2):
+            a = vertices[i]
+            b = vertices[i+1]
+            c = numpy.add(b, EXTRUDE_MAGNITUDE * numpy.subtract(b, light))
+            d = numpy.add(a, EXTRUDE_MAGNITUDE * numpy.subtract(a, light))
+            newVertices.extend([a,b,c])
+            newVertices.extend([a,c,d])
+        return numpy.array(newVertices, dtype=numpy.float32)
+
+    filenames = sys.argv[1:] or ["assets/obj/mengerfractal/MengerSpongerFractal.obj",
+                                 "assets/obj/tree-palmier/FR01a.obj"]
+    light = numpy.array([5.0, 10.0, 3.0])
+    for filename in filenames:
+        parser = ObjParser(filename)
+        mesh = Mesh(parser.getVertices(), parser.getFaces(), parser.getNormals())
+        edges = ContourEdges.forMesh(mesh).find(light)
+        start = time.time()
+        old = legacyExtrude(edges, light)
+        legacy = time.time() - start
+        # a scene twice as large as the mesh
+        bounds = parser.getBounds()
+        bounds = bounds + numpy.array([-1, 1], dtype=numpy.float32)[:, numpy.newaxis] * (bounds[1] - bounds[0]) / 2
+        start = time.time()
+        new = extrudeContour(edges, light, bounds=bounds)
+        vectorized = time.time() - start
+        inside = ((new >= bounds[0] - 1e-3) & (new <= bounds[1] + 1e-3)).all()
+        print("%s : %d edges, legacy %.4fs, vectorized %.4fs (x%.0f), %d triangles in the bounds : %s"
+              % (filename, len(edges), legacy, vectorized, legacy / max(vectorized, 1e-6),
+                 len(new) // 3, inside))
@@ -0,0 +1,83 @@
+#!/usr/bin/python2
+# -*- coding: utf8 -*-
+
+import threading
+
+
+class VolumeWorker(object):
+    """ Computes the shadow volumes of a frame on a thread while the render
+    thread draws the previous one. submit() hands a snapshot of the scene to
+    the worker, collect() waits for the result of the last submitted snapshot.
+    The function must not use GL : numpy and libvolume release the GIL, so
+    the work overlaps the GL calls of the render thread."""
+    def __init__(self, function):
+        self._function = function
+        self._thread = None
+        self._alive = False
+        self._snapshot = None
+        self._result = None
+        self._error = None
+        self._pending = False
+        self.lock = threading.Lock()
+        self._condition = threading.Condition(self.lock)
+
+    def _worker(self):
+        """ The thread's worker """
+        self._condition.acquire()
+        while True:
+            while self._alive and self._snapshot is None:
+                self._condition.wait()
+            if not self._alive:
+                break
+            snapshot = self._snapshot
+            self._snapshot = None
+            self._condition.release()
+            result, error = None, None
+            try:
+                result = self._function(snapshot)
+            except Exception as exception:
+                error = exception
+            self._condition.acquire()
+            self._result, self._error = result, error
+            self._pending = False
+            self._condition.notifyAll()
+        self._condition.release()
+
+    def start(self):
+        """ """
+        self._condition.acquire()
+        self._alive = True
+        self._condition.release()
+        self._thread = threading.Thread(target=self._worker)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ stop the thread once its current snapshot is done """
+        self._condition.acquire()
+        self._alive = False
+        self._condition.notifyAll()
+        self._condition.release()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, snapshot):
+        """ compute snapshot, collect() must be called before the next one """
+        self._condition.acquire()
+        self._snapshot = snapshot
+        self._pending = True
+        self._condition.notifyAll()
+        self._condition.release()
+
+    def collect(self):
+        """ result of the last snapshot (waiting for it), None if there is none """
+        self._condition.acquire()
+        while self._pending and self._alive:
+            self._condition.wait()
+        result, error = self._result, self._error
+        self._result, self._error = None, None
+        self._condition.release()
+        if error is not None:
+            raise error
+        return result
@@ -5,6 +5,11 @@
 #include <iostream>
 #include <ctime>
 #include <unordered_set>
+#include <thread>
+#include <atomic>
+#include <algorithm>
+#include <cmath>
+#include <limits>
 
 class Vector {
 public:
@@ -128,76 +133,288 @@ void computeTriangleCenter(Triangle* triangle, Vector* ret) {
 	ret->z = sumZ/3;
 }
 
-void findContourEdges2(Vector* positions, int* indices, Vector* normals, 
-					   int sizeIndices, Vector lightPosition, Edge* returnEdges, int* returnSize) {
-	std::unordered_set<Edge> edgesSet;
-	int index_indices;
-	Triangle triangle;
-	Vector triangleCenter;
-	Vector lightDir;
-	Vector triangleDir1, triangleDir2;
-	Vector triangleNormal;
-	float total_iter = 0, total_erase = 0;
-	for (index_indices = 0; index_indices < sizeIndices; index_indices+=3) {
-		clock_t time_beg = clock();
-		int a = indices[index_indices], b = indices[index_indices+1], c = indices[index_indices+2];
-		triangle.one = positions[a];
-		triangle.two = positions[b];
-		triangle.three = positions[c];
-		computeTriangleCenter(&triangle, &triangleCenter);
-		subtract(&triangleCenter, &lightPosition, &lightDir);
-		subtract(&triangle.two, &triangle.one, &triangleDir1);
-		subtract(&triangle.three, &triangle.one, &triangleDir2);
-		cross(&triangleDir1, &triangleDir2, &triangleNormal);
-		if (dot(&lightDir, &triangleNormal) >= 0) {
-			Edge edges[3];
-			edges[0].one = triangle.one;
-			edges[0].two = triangle.two;
-			edges[1].one = triangle.one;
-			edges[1].two = triangle.three;
-			edges[2].one = triangle.two;
-			edges[2].two = triangle.three;
-			Edge reverseEdges[3];
-			reverseEdges[0].two = triangle.one;
-			reverseEdges[0].one = triangle.two;
-			reverseEdges[1].two = triangle.one;
-			reverseEdges[1].one = triangle.three;
-			reverseEdges[2].two = triangle.two;
-			reverseEdges[2].one = triangle.three;
-			float time_float = ((float)(clock() - time_beg))/CLOCKS_PER_SEC;
-			total_iter += time_float;
-			time_beg = clock();
-			for (int i = 0; i < 3; ++i){
-				bool erased = false;
-				if (edgesSet.erase(edges[i]) != 0) {
-					erased = true;
+// a face is lit when the light is strictly in front of its plane (normal, d)
+inline bool isLit(const float* plane, const float* light) {
+	return plane[0] * light[0] + plane[1] * light[1] + plane[2] * light[2] + plane[3] > 0;
+}
+
+// Silhouette of a mesh for a light moving by small steps (see IncrementalSilhouette.py).
+// The facing of the faces is kept between two updates : the distance of the
+// light to a plane changes at most by the distance the light moved, so only
+// the faces closer to their plane than that (at the last full evaluation)
+// are tested again, and only the edges of the faces that flipped are patched.
+struct IncrementalSilhouette {
+	const float* positions;
+	const int* edges;
+	int nbEdges;
+	int nbFaces;
+	std::vector<float> planes; // normalized
+	std::vector<int> faceStarts;
+	std::vector<int> faceEdges;
+	std::vector<unsigned char> lit;
+	std::vector<float> margins;
+	float reference[3];
+	bool based;
+	// slot of each edge in the output (-1 if not in the silhouette) and edge of each slot
+	std::vector<int> slot;
+	std::vector<int> silhouette;
+	std::vector<int> changedStamp;
+	int stamp;
+	int count;
+	int tested;
+	float* output;
+};
+
+inline float planeDistance(const IncrementalSilhouette* state, int face, const float* light) {
+	const float* plane = &state->planes[4 * face];
+	return plane[0] * light[0] + plane[1] * light[1] + plane[2] * light[2] + plane[3];
+}
+
+inline bool edgeLit0(const IncrementalSilhouette* state, int edge) {
+	return state->lit[state->edges[4 * edge + 2]];
+}
+
+inline bool isSilhouetteEdge(const IncrementalSilhouette* state, int edge) {
+	const int* e = state->edges + 4 * edge;
+	bool lit1 = e[3] < 0 ? true : state->lit[e[3]];
+	return state->lit[e[2]] != lit1;
+}
+
+void addSilhouetteEdge(IncrementalSilhouette* state, int edge) {
+	const int* e = state->edges + 4 * edge;
+	bool lit0 = edgeLit0(state, edge);
+	int one = lit0 ? e[1] : e[0];
+	int two = lit0 ? e[0] : e[1];
+	float* out = state->output + 6 * state->count;
+	for (int k = 0; k < 3; ++k) {
+		out[k] = state->positions[3 * one + k];
+		out[3 + k] = state->positions[3 * two + k];
+	}
+	state->slot[edge] = state->count;
+	state->silhouette[state->count] = edge;
+	++state->count;
+}
+
+void removeSilhouetteEdge(IncrementalSilhouette* state, int edge) {
+	int s = state->slot[edge];
+	int last = state->count - 1;
+	if (s != last) {
+		std::copy(state->output + 6 * last, state->output + 6 * last + 6, state->output + 6 * s);
+		state->silhouette[s] = state->silhouette[last];
+		state->slot[state->silhouette[s]] = s;
+	}
+	state->slot[edge] = -1;
+	--state->count;
+}
+
+void rebaseSilhouette(IncrementalSilhouette* state, const float* light) {
+	for (int f = 0; f < state->nbFaces; ++f) {
+		float d = planeDistance(state, f, light);
+		const float* plane = &state->planes[4 * f];
+		bool degenerate = plane[0] == 0 and plane[1] == 0 and plane[2] == 0;
+		state->lit[f] = d > 0;
+		state->margins[f] = degenerate ? std::numeric_limits<float>::infinity() : std::fabs(d);
+	}
+	std::copy(light, light + 3, state->reference);
+	state->based = true;
+	state->tested = state->nbFaces;
+	std::fill(state->slot.begin(), state->slot.end(), -1);
+	state->count = 0;
+	for (int e = 0; e < state->nbEdges; ++e) {
+		if (isSilhouetteEdge(state, e)) {
+			addSilhouetteEdge(state, e);
+		}
+	}
+}
+
+extern "C" {
+	// Silhouette of a mesh seen from lightPosition, in one pass over its
+	// adjacency (see EdgeAdjacency.py) :
+	// edges is int[4 * nbEdges] (v0, v1, face0, face1 or -1), planes float[4 * nbFaces],
+	// positions float[3 * n] and returnEdges float[6 * nbEdges].
+	// An edge is kept when one of its faces is lit and the other is not (or
+	// when the only face of a border edge is not lit), and is written in the
+	// winding of its unlit face. Return the number of edges written.
+	int findSilhouetteEdges(const float* positions, const int* edges, int nbEdges,
+							const float* planes, const float* lightPosition, float* returnEdges)
+	{
+		int returnSize = 0;
+		for (int i = 0; i < nbEdges; ++i) {
+			const int* edge = edges + 4 * i;
+			bool lit0 = isLit(planes + 4 * edge[2], lightPosition);
+			bool lit1 = edge[3] < 0 ? true : isLit(planes + 4 * edge[3], lightPosition);
+			if (lit0 == lit1) {
+				continue;
+			}
+			int one = lit0 ? edge[1] : edge[0];
+			int two = lit0 ? edge[0] : edge[1];
+			float* out = returnEdges + 6 * returnSize;
+			for (int k = 0; k < 3; ++k) {
+				out[k] = positions[3 * one + k];
+				out[3 + k] = positions[3 * two + k];
+			}
+			++returnSize;
+		}
+		return returnSize;
+	}
+
+	// findSilhouetteEdges for nbObjects objects and nbLights lights on a pool
+	// of nbThreads threads (0 : one per core). Job j = object * nbLights + light
+	// uses the arrays of its object, the light lightPositions[3 * j] (in the
+	// object space) and writes at most nbEdges[object] edges at
+	// returnEdges + 6 * offsets[j], the number written going to returnCounts[j].
+	// If active is not NULL, only the jobs with active[j] != 0 are run.
+	void findSilhouetteEdgesBatch(int nbObjects, int nbLights, const float** positions,
+								  const int** edges, const int* nbEdges, const float** planes,
+								  const float* lightPositions, const unsigned char* active,
+								  float* returnEdges, const int* offsets, int* returnCounts, int nbThreads)
+	{
+		int nbJobs = nbObjects * nbLights;
+		if (nbThreads <= 0) {
+			nbThreads = std::max(1u, std::thread::hardware_concurrency());
+		}
+		nbThreads = std::min(nbThreads, nbJobs);
+		std::atomic<int> nextJob(0);
+		auto worker = [&]() {
+			for (int job = nextJob++; job < nbJobs; job = nextJob++) {
+				if (active != NULL and not active[job]) {
+					continue;
 				}
-				if (edgesSet.erase(reverseEdges[i]) != 0) {
-					erased = true;
+				int object = job / nbLights;
+				returnCounts[job] = findSilhouetteEdges(positions[object], edges[object], nbEdges[object],
+														planes[object], lightPositions + 3 * job,
+														returnEdges + 6 * (long) offsets[job]);
+			}
+		};
+		std::vector<std::thread> threads;
+		for (int i = 1; i < nbThreads; ++i) {
+			threads.push_back(std::thread(worker));
+		}
+		worker();
+		for (size_t i = 0; i < threads.size(); ++i) {
+			threads[i].join();
+		}
+	}
+
+	// positions float[3 * n], edges int[4 * nbEdges] and planes float[4 * nbFaces]
+	// (EdgeAdjacency) must outlive the state, the silhouette is kept in
+	// output float[6 * nbEdges]
+	void* createIncrementalSilhouette(const float* positions, const int* edges, int nbEdges,
+									  const float* planes, int nbFaces, float* output)
+	{
+		IncrementalSilhouette* state = new IncrementalSilhouette();
+		state->positions = positions;
+		state->edges = edges;
+		state->nbEdges = nbEdges;
+		state->nbFaces = nbFaces;
+		state->planes.resize(4 * nbFaces);
+		for (int f = 0; f < nbFaces; ++f) {
+			const float* plane = planes + 4 * f;
+			float norm = std::sqrt(plane[0] * plane[0] + plane[1] * plane[1] + plane[2] * plane[2]);
+			if (norm == 0) {
+				norm = 1;
+			}
+			for (int k = 0; k < 4; ++k) {
+				state->planes[4 * f + k] = plane[k] / norm;
+			}
+		}
+		// edges of each face
+		state->faceStarts.assign(nbFaces + 1, 0);
+		for (int e = 0; e < nbEdges; ++e) {
+			for (int k = 2; k < 4; ++k) {
+				if (edges[4 * e + k] >= 0) {
+					++state->faceStarts[edges[4 * e + k] + 1];
+				}
+			}
+		}
+		for (int f = 0; f < nbFaces; ++f) {
+			state->faceStarts[f + 1] += state->faceStarts[f];
+		}
+		state->faceEdges.resize(state->faceStarts[nbFaces]);
+		std::vector<int> fill(state->faceStarts.begin(), state->faceStarts.end() - 1);
+		for (int e = 0; e < nbEdges; ++e) {
+			for (int k = 2; k < 4; ++k) {
+				if (edges[4 * e + k] >= 0) {
+					state->faceEdges[fill[edges[4 * e + k]]++] = e;
+				}
+			}
+		}
+		state->lit.resize(nbFaces);
+		state->margins.resize(nbFaces);
+		state->slot.assign(nbEdges, -1);
+		state->silhouette.resize(nbEdges);
+		state->changedStamp.assign(nbEdges, 0);
+		state->stamp = 0;
+		state->based = false;
+		state->count = 0;
+		state->tested = 0;
+		state->output = output;
+		return state;
+	}
+
+	// Move the light (object space) and patch the silhouette. A full
+	// evaluation is done when more than rebaseRatio of the faces would be
+	// tested. Return the number of edges in the output.
+	int updateIncrementalSilhouette(void* handle, const float* light, float rebaseRatio)
+	{
+		IncrementalSilhouette* state = (IncrementalSilhouette*) handle;
+		if (not state->based) {
+			rebaseSilhouette(state, light);
+			return state->count;
+		}
+		float dx = light[0] - state->reference[0];
+		float dy = light[1] - state->reference[1];
+		float dz = light[2] - state->reference[2];
+		float moved = std::sqrt(dx * dx + dy * dy + dz * dz);
+		std::vector<int> candidates;
+		int maxCandidates = (int) (rebaseRatio * state->nbFaces);
+		for (int f = 0; f < state->nbFaces; ++f) {
+			if (state->margins[f] <= moved) {
+				if ((int) candidates.size() >= maxCandidates) {
+					rebaseSilhouette(state, light);
+					return state->count;
 				}
-				if (not erased) {
-					edgesSet.insert(edges[i]);
+				candidates.push_back(f);
+			}
+		}
+		state->tested = candidates.size();
+		std::vector<int> flipped;
+		for (size_t i = 0; i < candidates.size(); ++i) {
+			int f = candidates[i];
+			bool lit = planeDistance(state, f, light) > 0;
+			if (lit != (bool) state->lit[f]) {
+				state->lit[f] = lit;
+				flipped.push_back(f);
+			}
+		}
+		// the edges of the flipped faces, each one once
+		++state->stamp;
+		for (size_t i = 0; i < flipped.size(); ++i) {
+			int f = flipped[i];
+			for (int j = state->faceStarts[f]; j < state->faceStarts[f + 1]; ++j) {
+				int e = state->faceEdges[j];
+				if (state->changedStamp[e] == state->stamp) {
+					continue;
+				}
+				state->changedStamp[e] = state->stamp;
+				if (state->slot[e] >= 0) {
+					removeSilhouetteEdge(state, e);
+				}
+				if (isSilhouetteEdge(state, e)) {
+					addSilhouetteEdge(state, e);
 				}
 			}
-			time_float = ((float)(clock() - time_beg))/CLOCKS_PER_SEC;
-			total_erase += time_float;
 		}
+		return state->count;
 	}
-	// std::cout << "Total iter : " << total_iter << std::endl;
-	// std::cout << "Total erase : " << total_erase << std::endl;
-	std::unordered_set<Edge>::iterator it;
-	int i = 0;
-	for (it = edgesSet.begin(); it != edgesSet.end(); ++it) {
-		returnEdges[i++] = *it;
+
+	int getIncrementalTestedFaces(void* handle)
+	{
+		return ((IncrementalSilhouette*) handle)->tested;
 	}
-	*returnSize = edgesSet.size();
-}
 
-extern "C" {
-	void findContourEdges(Vector* positions, int* indices, Vector* normals,
-					       int sizeIndices, Vector lightPosition, Edge* returnEdges, int* returnSize)
+	void destroyIncrementalSilhouette(void* handle)
 	{
-		findContourEdges2(positions, indices, normals, sizeIndices, lightPosition, returnEdges, returnSize);
+		delete (IncrementalSilhouette*) handle;
 	}
 }
-
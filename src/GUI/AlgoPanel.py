@@ -24,10 +24,22 @@ class AlgoPanel(QtGui.QMainWindow):
         
         self.text = QtGui.QTextEdit(self)
         self.text.setText("""
-            anti-aliasing-int : 4
-            anti-aliasing-float : 4.0
+            anti-aliasing-int : 2
+            anti-aliasing-float : 2.0
             spreading : 700.0
-            bias : 0.05""")
+            bias : 0.05
+            gpu-extrusion : 1
+            incremental-silhouette : 1
+            orbit-cache : 0
+            orbit-cache-mb : 256
+            packed-volumes : 1
+            volume-culling : 1
+            pipelined-volumes : 1
+            shadow-map-size : 1024
+            shadow-map-format : 24
+            shadow-map-fit : 1
+            shadow-cascades : 1
+            shadow-atlas-size : 2048""")
         
         self.setCentralWidget(self.text)
         self.setGeometry(300,300,300,300)
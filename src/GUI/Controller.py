@@ -56,6 +56,7 @@ class Controller(object):
         self._setStatusComputing()
         scene = str(item.parent().text(0))
         algo = str(item.text(0))
+        self._releaseGLWidget()
         if algo == "Ray Tracing":
             self._glWidget = RayTracingWidget(self)
         else:
@@ -67,6 +68,7 @@ class Controller(object):
         """ Set the right widget in the splitpane as help """
         self._setStatusComputing()
         self._replaceRightWidget(self._helpWidget)
+        self._releaseGLWidget()
         self._glWidget = None
         self._setStatusReady()
 
@@ -76,6 +78,7 @@ class Controller(object):
         if self._glWidget:
             obj = self._glWidget.getObjectNames()
             algo = self._glWidget.getChosenAlgoName()
+            self._releaseGLWidget()
             self._glWidget = OpenGLWidget(obj,algo,self,self._options)
             self._replaceRightWidget(self._glWidget)
         else:
@@ -117,6 +120,11 @@ class Controller(object):
                     print("[WARNING] : Two scenes with same name found : the first one will be overwrited!")
                 self._scene[name] = dicti
 
+    def _releaseGLWidget(self):
+        """ release the meshes shared by the current OpenGLWidget """
+        if isinstance(self._glWidget, OpenGLWidget):
+            self._glWidget.releaseObjects()
+
     def _replaceRightWidget(self,newWidget):
         """ replace the splitpane right widget"""
         self._splitPane.replaceRightWidget(newWidget)
@@ -143,9 +151,27 @@ class Controller(object):
         msg += "%  |  "
         msg += "Nombre de lampe : "
         msg += str(len(self._lightCollection))
+        stencil = self._performanceIndication.getStencilStats()
+        if stencil:
+            msg += "  |  "
+            msg += "Passe stencil : "
+            msg += stencil
+        shadowMaps = self._performanceIndication.getShadowMapStats()
+        if shadowMaps:
+            msg += "  |  "
+            msg += "Shadow maps : "
+            msg += shadowMaps
             
         self._statusBar.showMessage(msg)
 
+    def setStencilStats(self, stats):
+        """ """
+        self._performanceIndication.setStencilStats(stats)
+
+    def setShadowMapStats(self, stats):
+        """ """
+        self._performanceIndication.setShadowMapStats(stats)
+
     def switchLightAnimation(self):
         """ """
         if self._lightCollection:
@@ -8,7 +8,8 @@ from vispy import gloo
 from threading import Thread, Lock
 import numpy
 
-from GLShadow.ObjParser import ObjParser
+from GLShadow.SceneLoader import SceneLoader
+from GLShadow.MeshRegistry import meshRegistry
 from GLShadow.Camera import Camera
 from GLShadow.Algorithms import ShadowMapAlgorithm,ShadowVolumeAlgorithm,NoShadowAlgorithm,SelfShadowAlgorithm,DEFAULT_SHAPE
 from GLShadow.SceneObject import SceneObject
@@ -49,6 +50,14 @@ class OpenGLWidget(QtOpenGL.QGLWidget):
             self._softFPS.append(instantFps)
         else:
             fps = sum(self._softFPS) / len(self._softFPS)
+            stats = None
+            if hasattr(self._chosenAlgo, "getStencilStats"):
+                stats = self._chosenAlgo.getStencilStats()
+            self._controller.setStencilStats(stats)
+            stats = None
+            if hasattr(self._chosenAlgo, "getShadowMapRenders"):
+                stats = (self._chosenAlgo.getShadowMapRenders(), self._chosenAlgo.getShadowTriangles())
+            self._controller.setShadowMapStats(stats)
             self._controller.setFPS(fps)
             self._softFPS = []
         self.updateGL()
@@ -207,7 +216,8 @@ class OpenGLWidget(QtOpenGL.QGLWidget):
         # O = [0,1, 1,2, 2,3, 3,0,
         #      4,7, 7,6, 6,5, 5,4,
         #      0,5, 1,6, 2,7, 3,4 ]
-        obj = SceneObject(vertices, I, normals, position)
+        # the ground is under everything : it never shadows anything
+        obj = SceneObject(vertices, I, normals, position, castsShadow=False)
         self._objects.append(obj)
  
     def _makeCube(self, position):
@@ -224,21 +234,40 @@ class OpenGLWidget(QtOpenGL.QGLWidget):
         self._objects.append(obj)
 
     def _loadObjects(self):
+        # parse in parallel, each distinct file once
+        names = [obj[0] for obj in self._objectNames if not meshRegistry.contains(obj[0])]
+        parsers = SceneLoader().load(names)
         for obj in self._objectNames:
-            parser = ObjParser(obj[0])
             position = obj[1]
             texture = None
             color = None
-            if len(obj) == 3:
-                if isinstance(obj[2], unicode):
-                    texture = obj[2]
-                    color = None
-                elif isinstance(obj[2], list):
-                    texture = None
-                    color = obj[2]
-            sceneObj = SceneObject(parser.getVertices(), parser.getFaces(), parser.getNormals(), position, color, texture, parser.getTextureCoords())
+            flags = {}
+            # then a texture or a color, and the shadow flags :
+            # {"casts_shadow": false, "receives_shadow": true}
+            for extra in obj[2:]:
+                if isinstance(extra, unicode):
+                    texture = extra
+                elif isinstance(extra, list):
+                    color = extra
+                elif isinstance(extra, dict):
+                    flags = extra
+            # instances of the same file share their mesh and GPU buffers
+            sceneObj = meshRegistry.createObject(obj[0], position, color, texture, parsers.get(obj[0]))
+            sceneObj.setCastsShadow(bool(flags.get("casts_shadow", True)))
+            sceneObj.setReceivesShadow(bool(flags.get("receives_shadow", True)))
             self._objects.append(sceneObj)
 
+    def releaseObjects(self):
+        """ Give back the shared meshes, to call before dropping the widget """
+        self._mutex.acquire()
+        # the GL objects are deleted in the context that owns them
+        self.makeCurrent()
+        for obj in getattr(self, "_objects", []):
+            meshRegistry.releaseObject(obj)
+        self._objects = []
+        self._chosenAlgo.terminate()
+        self._mutex.release()
+
 
     def switchCameraAnimation(self):
         """ """
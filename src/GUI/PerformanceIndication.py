@@ -15,6 +15,11 @@ class PerformanceIndication(object):
         self._thread = None
         self._alive = False
         self._cpu = "None"
+        self._stencilStats = None
+        # (shadow maps rendered, triangles drawn) : totals at the last update,
+        # and since the one before
+        self._shadowMapStats = None
+        self._recentShadowMapStats = None
         self._p = psutil.Process(os.getpid())
         self.lock = threading.Lock()
         self.start()
@@ -25,6 +30,35 @@ class PerformanceIndication(object):
     def getMemoryPercent(self):
         return str(round(self._p.memory_percent(),1))
 
+    def setStencilStats(self, stats):
+        """ (draw calls, milliseconds, area) of the stencil passes, None if
+        the algorithm has none """
+        self._stencilStats = stats
+
+    def getStencilStats(self):
+        """ the stencil passes as text, "" if unknown """
+        if self._stencilStats is None or self._stencilStats[1] is None:
+            return ""
+        return "%d appels, %.3f ms, %.2f vues" % self._stencilStats
+
+    def setShadowMapStats(self, stats):
+        """ (shadow maps rendered, triangles drawn by the shadow passes) since
+        the algorithm was initialized, None if the algorithm has none """
+        if stats is None:
+            self._recentShadowMapStats = None
+        elif self._shadowMapStats is None or stats[0] < self._shadowMapStats[0]:
+            # new algorithm
+            self._recentShadowMapStats = stats
+        else:
+            self._recentShadowMapStats = (stats[0] - self._shadowMapStats[0], stats[1] - self._shadowMapStats[1])
+        self._shadowMapStats = stats
+
+    def getShadowMapStats(self):
+        """ the shadow passes since the previous update as text, "" if unknown """
+        if self._recentShadowMapStats is None:
+            return ""
+        return "%d rendues, %d triangles" % self._recentShadowMapStats
+
 
     def _worker(self):
         """ The thread's worker """